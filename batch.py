@@ -0,0 +1,137 @@
+# Monthly reports for every area, vendor and store combination, without the UI.
+#
+#   python batch.py                                  # latest month, overall + per area + per vendor
+#   python batch.py --year 2024 --month 5 --by area+vendor,store
+#   python batch.py --offline                        # from the local snapshot, without syncing
+#
+# The data is synced once into the local snapshot (or, offline, only the
+# month's partition is read from it), the month is cut out of it and handed
+# to a process pool, and every report is written as
+# <out>/<YYYY-MM>/<name>.html and .csv with the monthly page's aggregation
+# and HTML.
+
+import argparse
+import concurrent.futures
+import functools
+import os
+import re
+import time
+
+from quota import QuotaSource
+from reports import COMPLIANCE, iter_csv, monthly_html, monthly_report, sort_vendors
+from snapshot import SNAPSHOT_DIR, SnapshotStore
+from sources import DATA_SOURCE, open_source
+from store import DataStore, Dataset, month_range
+from sync import SheetSync
+
+OUT_DIR = "reports"
+
+# --by names -> filter columns
+DIMENSIONS = {"area": "ภาค", "vendor": "ผู้รับเหมา", "store": "รหัสร้าน"}
+
+_data = None  # the month's Dataset, set once in every worker
+
+
+# Filter dicts for every combination of the given dimensions seen in the
+# month, e.g. ["area", "vendor"] -> one per (ภาค, ผู้รับเหมา) pair; [] -> all rows
+def combinations(data, dimensions):
+    if not dimensions:
+        return [{}]
+    columns = [DIMENSIONS[d] for d in dimensions]
+    pairs = data.cube.table[columns].drop_duplicates().sort_values(columns)
+    return [dict(zip(columns, values)) for values in pairs.itertuples(index=False)]
+
+
+# File name of a report, e.g. "all" or "area=BE_vendor=xyz"
+def report_name(filters):
+    if not filters:
+        return "all"
+    names = {column: name for name, column in DIMENSIONS.items()}
+    name = "_".join(f"{names[column]}={value}" for column, value in filters.items())
+    return re.sub(r'[\\/:*?"<>|\s]+', "-", name)
+
+
+# Offline: (year, month, rows) of the requested month, the latest one in the
+# snapshot by default, read from its partition alone
+def read_month(parser, snapshot, year, month):
+    latest = snapshot.latest_month()
+    if latest is None:
+        parser.exit(1, "No local snapshot to load offline\n")
+    year, month = year or latest[0], month or latest[1]
+    df = snapshot.read_month(year, month)
+    if df is None or df.empty:
+        parser.exit(1, "No inspections to report on\n")
+    return year, month, df
+
+
+def _init_worker(data):
+    global _data
+    _data = data
+
+
+# Render one report into folder; returns (name, written)
+def render(filters, year, month, folder, formats):
+    report = monthly_report(_data, filters, *month_range(year, month))
+    name = report_name(filters)
+    if report is None:
+        return name, False
+    vendors = sort_vendors(report["vendor_analysis"], "Compliance, worst first")
+    path = os.path.join(folder, name)
+    if "html" in formats:
+        table = vendors.assign(**{COMPLIANCE: (vendors[COMPLIANCE] * 100).round(1)}).to_html(index=False, border=0)
+        title = " / ".join(str(value) for value in filters.values()) or "ทั้งหมด"
+        with open(path + ".html", "w", encoding="utf-8") as f:
+            f.write(monthly_html(report, year, month, f"<h2>{title}</h2>{table}"))
+    if "csv" in formats:
+        with open(path + ".csv", "wb") as f:
+            for chunk in iter_csv(vendors):
+                f.write(chunk)
+    return name, True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the monthly report for every area, vendor and store combination")
+    parser.add_argument("--year", type=int, help="default: the month of the latest inspection")
+    parser.add_argument("--month", type=int)
+    parser.add_argument("--by", default="all,area,vendor", help="comma separated groupings, each 'all' or dimensions joined by '+' from " + ", ".join(DIMENSIONS))
+    parser.add_argument("--formats", default="html,csv")
+    parser.add_argument("--out", default=OUT_DIR)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--source", default=DATA_SOURCE, help="HELMET_SOURCE style data source spec")
+    parser.add_argument("--snapshot-dir", default=SNAPSHOT_DIR)
+    parser.add_argument("--offline", action="store_true", help="use the local snapshot without syncing it")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.offline:
+        year, month, df = read_month(parser, SnapshotStore(args.snapshot_dir), args.year, args.month)
+        month_data = Dataset(df)
+        print(f"Loaded {len(month_data.df):,} rows of {year}-{month:02d} from the snapshot in {time.perf_counter() - started:.1f}s")
+    else:
+        store = DataStore(SheetSync(QuotaSource(open_source(args.source))), SnapshotStore(args.snapshot_dir))
+        data = store.load()
+        span = data.span()
+        if span is None:
+            parser.exit(1, "No inspections to report on\n")
+        year, month = args.year or span[1].year, args.month or span[1].month
+        print(f"Loaded {len(data.df):,} rows from the {store.source} in {time.perf_counter() - started:.1f}s")
+        # Workers only receive the month's rows
+        month_data = Dataset(data.select(*month_range(year, month)).reset_index(drop=True))
+    jobs = []
+    for grouping in args.by.split(","):
+        dimensions = [] if grouping.strip() == "all" else grouping.strip().split("+")
+        jobs += combinations(month_data, dimensions)
+    folder = os.path.join(args.out, f"{year}-{month:02d}")
+    os.makedirs(folder, exist_ok=True)
+    formats = set(args.formats.split(","))
+
+    started = time.perf_counter()
+    render_month = functools.partial(render, year=year, month=month, folder=folder, formats=formats)
+    chunksize = max(1, len(jobs) // (4 * args.workers))
+    with concurrent.futures.ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=(month_data,)) as pool:
+        written = sum(ok for _, ok in pool.map(render_month, jobs, chunksize=chunksize))
+    print(f"Wrote {written} reports for {year}-{month:02d} to {folder} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
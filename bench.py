@@ -0,0 +1,152 @@
+# Benchmark of the dashboard's data path on synthetic inspection logs.
+#
+#   python bench.py                      # 10k, 100k and 1M rows
+#   python bench.py --sizes 10m          # the 10M row run needs several GB of RAM
+#   python bench.py --compare            # medians per commit from the results file
+#
+# Every stage is timed without Streamlit and appended to the results file as
+# one JSON line per (size, stage), tagged with the current git commit.
+
+import argparse
+import datetime
+import json
+import statistics
+import subprocess
+import time
+
+import numpy as np
+import pandas as pd
+
+from reports import PARTS, group_totals, hotspots, monthly_report, overview, trend
+from store import Dataset, day_range, month_range
+from sync import prepare
+
+RESULTS_FILE = "bench_results.jsonl"
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+
+# Raw inspection log as read from the sheet: text cells, one row per
+# inspection, in time order over `years` years. Every store belongs to one
+# area and one vendor.
+def make_inspections(n, seed=0, vendors=300, stores=5000, years=3, start="2022-01-01"):
+    rng = np.random.default_rng(seed)
+    seconds = np.sort(rng.integers(0, years * 365 * 86400, n))
+    times = np.datetime64(f"{start}T00:00:00") + seconds.astype("timedelta64[s]")
+    store_ids = np.array([f"{i:05d}" for i in range(1, stores + 1)], dtype=object)
+    vendor_names = np.array([f"ผู้รับเหมา {i:03d}" for i in range(1, vendors + 1)], dtype=object)
+    store_area = rng.choice(np.array(PARTS, dtype=object), stores)
+    store_vendor = rng.choice(vendor_names, stores)
+    store = rng.integers(0, stores, n)
+    persons = rng.integers(1, 20, n)
+    no_helmet = rng.binomial(persons, 0.1)
+    return pd.DataFrame({
+        "เวลา": np.datetime_as_string(times, unit="s"),
+        "ภาค": store_area[store],
+        "หมายเหตุ": "",
+        "รหัสร้าน": store_ids[store],
+        "ผู้รับเหมา": store_vendor[store],
+        "จำนวนคนใส่หมวก": (persons - no_helmet).astype(str),
+        "คนไม่ใส่หมวก": no_helmet.astype(str),
+        "คนทั้งหมด": persons.astype(str),
+    })
+
+
+def timed(fn, repeat):
+    times, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return result, times
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+# Time every stage for one log size; returns {stage: [seconds, ...]}
+def run_size(n, repeat):
+    raw = make_inspections(n)
+    new_raw = make_inspections(1000, seed=1, start="2025-01-01")
+    timings = {}
+
+    df, timings["ingest"] = timed(lambda: prepare(raw.copy(deep=False)), repeat)
+    data, timings["build_index_cube"] = timed(lambda: Dataset(df), repeat)
+    new = prepare(new_raw)
+    _, timings["append_1000"] = timed(lambda: data.extend(new), repeat)
+
+    middle = df["เวลา"].iloc[len(df) // 2]
+    day = day_range(middle.date())
+    month = month_range(middle.year, middle.month)
+    span = (df["เวลา"].iloc[0].date(), df["เวลา"].iloc[-1].date())
+    row = df.iloc[len(df) // 2]
+    filter_sets = {
+        "all": {},
+        "area": {"ภาค": row["ภาค"]},
+        "vendor": {"ผู้รับเหมา": row["ผู้รับเหมา"]},
+        "store": {"รหัสร้าน": row["รหัสร้าน"]},
+    }
+    for name, filters in filter_sets.items():
+        _, timings[f"overview_{name}"] = timed(lambda: overview(data, filters, *day), repeat)
+        _, timings[f"by_area_{name}"] = timed(lambda: group_totals(data, "ภาค", filters, *day), repeat)
+        _, timings[f"by_vendor_{name}"] = timed(lambda: group_totals(data, "ผู้รับเหมา", filters, *day), repeat)
+        _, timings[f"monthly_{name}"] = timed(lambda: monthly_report(data, filters, *month), repeat)
+        _, timings[f"trend_weekly_{name}"] = timed(lambda: trend(data, "ภาค", filters, *span, "Weekly"), repeat)
+        _, timings[f"hotspots_{name}"] = timed(lambda: hotspots(data, "รหัสร้าน", filters, 7, 20), repeat)
+    return timings
+
+
+# Median seconds per (rows, stage) for each commit found in the results file
+def compare(path):
+    results = {}
+    commits = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            r = json.loads(line)
+            if r["commit"] not in commits:
+                commits.append(r["commit"])
+            results[(r["rows"], r["stage"], r["commit"])] = r["median_s"]
+    commits = commits[-5:]
+    print(f"{'rows':>10} {'stage':<22}" + "".join(f"{str(c):>12}" for c in commits))
+    for rows, stage in sorted({(k[0], k[1]) for k in results}):
+        cells = [results.get((rows, stage, c)) for c in commits]
+        print(f"{rows:>10} {stage:<22}" + "".join(f"{v:>12.4f}" if v is not None else f"{'-':>12}" for v in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard data path on synthetic inspection logs")
+    parser.add_argument("--sizes", default="10k,100k,1m", help="comma separated, from " + ", ".join(SIZES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", default=RESULTS_FILE)
+    parser.add_argument("--compare", action="store_true", help="print the recorded results and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.out)
+        return
+
+    run = datetime.datetime.now().isoformat(timespec="seconds")
+    commit = git_commit()
+    with open(args.out, "a", encoding="utf-8") as out:
+        for size in args.sizes.split(","):
+            n = SIZES[size.strip().lower()]
+            for stage, times in run_size(n, args.repeat).items():
+                record = {
+                    "run": run,
+                    "commit": commit,
+                    "rows": n,
+                    "stage": stage,
+                    "repeat": len(times),
+                    "min_s": min(times),
+                    "median_s": statistics.median(times),
+                }
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                print(f"{n:>10} {stage:<22} {record['median_s']:.4f}s")
+
+
+if __name__ == "__main__":
+    main()
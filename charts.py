@@ -0,0 +1,92 @@
+import plotly.graph_objects as go
+
+from reports import COMPLIANCE, PERIOD, group_totals, top_groups, trend
+
+# Bars drawn per group chart; the remaining groups share one "others" bar
+TOP_N = 20
+
+# Above this many groups the trend chart is a heatmap instead of one line per group
+HEATMAP_GROUPS = 15
+
+# Figure specs for the dashboard charts, as plain dicts so they can be kept
+# in the result cache and reused by every session until the data changes.
+
+
+# By-Area and by-Vendor pages: wearing / not wearing bars per group, for the
+# TOP_N groups with the most people checked
+def group_chart(data, column, filters, start, end, title):
+    table = top_groups(group_totals(data, column, filters, start, end), column, TOP_N)
+    fig = go.Figure()
+
+    fig.add_trace(go.Bar(
+        x=table[column],
+        y=table["จำนวนคนใส่หมวก"],
+        name='จำนวนคนใส่หมวก',
+        textposition='outside'
+    ))
+
+    fig.add_trace(go.Bar(
+        x=table[column],
+        y=table["คนไม่ใส่หมวก"],
+        name='คนไม่ใส่หมวก',
+        textposition='outside'
+    ))
+
+    fig.update_layout(
+        barmode='group',
+        title=title,
+        xaxis_title="Part",
+        yaxis_title="Count",
+        legend_title="Type",
+        dragmode="pan"
+    )
+    return fig.to_dict()
+
+
+# Date-range page: compliance per period, one line per group, or a single
+# heatmap (groups x periods, worst group on top) when there are many groups
+def trend_chart(data, column, filters, start, end, freq, legend_title):
+    table = trend(data, column, filters, start, end, freq)
+    fig = go.Figure()
+    groups = 1 if column is None else table[column].nunique()
+    if groups > HEATMAP_GROUPS:
+        table = table.astype({column: object})
+        totals = table.groupby(column)[["จำนวนคนใส่หมวก", "คนทั้งหมด"]].sum()
+        order = (totals["จำนวนคนใส่หมวก"] / totals["คนทั้งหมด"]).sort_values(ascending=False).index
+        grid = table.pivot(index=column, columns=PERIOD, values=COMPLIANCE).reindex(order).mul(100).round(1)
+        fig.add_trace(go.Heatmap(
+            z=grid.to_numpy(),
+            x=grid.columns,
+            y=grid.index,
+            zmin=0,
+            zmax=100,
+            colorscale="RdYlGn",
+            colorbar_title="%",
+            hovertemplate="%{y}<br>%{x}<br>%{z:.1f}%<extra></extra>",
+        ))
+        fig.update_layout(
+            title=f"{freq} helmet compliance (%)",
+            xaxis_title="Period",
+            yaxis_title=legend_title,
+            height=max(400, 18 * groups + 150),
+        )
+        return fig.to_dict()
+    lines = [(None, table)] if column is None else table.groupby(column, observed=True, sort=True)
+    for name, rows in lines:
+        fig.add_trace(go.Scatter(
+            x=rows[PERIOD],
+            y=rows[COMPLIANCE] * 100,
+            mode="lines+markers",
+            name=name or "ทั้งหมด",
+            customdata=rows[["จำนวนคนใส่หมวก", "คนไม่ใส่หมวก"]],
+            hovertemplate="%{y:.1f}%<br>ใส่หมวก %{customdata[0]} / ไม่ใส่หมวก %{customdata[1]}",
+        ))
+    fig.update_layout(
+        title=f"{freq} helmet compliance",
+        xaxis_title="Period",
+        yaxis_title="Wearing helmet (%)",
+        yaxis_range=[0, 100],
+        legend_title=legend_title,
+        dragmode="pan"
+    )
+    return fig.to_dict()
@@ -0,0 +1,58 @@
+from index import as_values, time_bounds
+from schema import COUNT_COLUMNS, concat
+
+DAY = "วันที่"
+KEYS = [DAY, "ภาค", "ผู้รับเหมา", "รหัสร้าน"]
+
+
+# Daily totals of the count columns per area, vendor and store. Totals are
+# int64: the per-row count type is too small to hold a sum.
+def rollup(df):
+    day = df["เวลา"].dt.normalize().rename(DAY)
+    table = df.groupby([day, "ภาค", "ผู้รับเหมา", "รหัสร้าน"], sort=True, observed=True)[COUNT_COLUMNS].sum()
+    return table.astype("int64").reset_index()
+
+
+# Pre-aggregated day x area x vendor x store cube, sorted by day. Pages sum
+# over this instead of the raw rows, so their cost follows the number of
+# (day, area, vendor, store) cells in the range rather than the row count.
+class Cube:
+    def __init__(self, table):
+        self.table = table
+
+    @classmethod
+    def build(cls, df):
+        return cls(rollup(df))
+
+    # New cube with the rows folded in. Only the days from the earliest new
+    # day onwards are re-aggregated; for an append-only log that is the tail.
+    def extend(self, new):
+        partial = rollup(new)
+        if partial.empty:
+            return self
+        split = self.table[DAY].searchsorted(partial[DAY].iloc[0], side="left")
+        tail = concat([self.table.iloc[split:], partial])
+        tail = tail.groupby(KEYS, sort=True, observed=True)[COUNT_COLUMNS].sum().reset_index()
+        return Cube(concat([self.table.iloc[:split], tail]))
+
+    # Cube cells with start <= day < end matching every {column: value or
+    # values} filter. Membership is tested on the category codes, and all
+    # filters are combined into one mask before the cells are taken.
+    def select(self, start=None, end=None, filters=None):
+        lo, hi = time_bounds(self.table, start, end, DAY)
+        table = self.table.iloc[lo:hi]
+        if not filters:
+            return table
+        mask = None
+        for col, selection in filters.items():
+            matches = table[col].isin(as_values(selection)).to_numpy()
+            mask = matches if mask is None else mask & matches
+        return table[mask]
+
+    def totals(self, start=None, end=None, filters=None):
+        return self.select(start, end, filters)[COUNT_COLUMNS].sum()
+
+    # Count columns summed per value of column, e.g. per ภาค or ผู้รับเหมา
+    def totals_by(self, column, start=None, end=None, filters=None):
+        table = self.select(start, end, filters)
+        return table.groupby(column, sort=True, observed=True)[COUNT_COLUMNS].sum().reset_index()
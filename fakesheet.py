@@ -0,0 +1,95 @@
+import csv
+import json
+import os
+import random
+import re
+import threading
+import time
+
+import gspread
+import requests
+
+# Share of requests the fake sheet answers with HTTP 429, for HELMET_SOURCE=fake:<csv>
+FAKE_ERROR_RATE = float(os.environ.get("HELMET_FAKE_429_RATE", "0"))
+
+
+def api_error(status, message):
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps({"error": {"code": status, "message": message, "status": "RESOURCE_EXHAUSTED"}}).encode()
+    return gspread.exceptions.APIError(response)
+
+
+# In-memory stand-in for a gspread Worksheet, answering the calls GSheetSource
+# makes. It can be told to fail the next requests, or a share of all
+# requests, with quota errors (429) so retry and fallback behaviour can be
+# exercised offline.
+class FakeSheet:
+    def __init__(self, values, error_rate=0.0, latency=0.0, seed=None):
+        self.values = [list(row) for row in values]
+        self.error_rate = error_rate
+        self.latency = latency
+        self.requests = 0
+        self.errors = 0
+        self._fail_next = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_csv(cls, path, **kwargs):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            return cls(list(csv.reader(f)), **kwargs)
+
+    # Answer the next n requests with the given HTTP status
+    def fail_next(self, n=1, status=429):
+        with self._lock:
+            self._fail_next += [status] * n
+
+    def append_row(self, row):
+        with self._lock:
+            self.values.append(list(row))
+
+    def _request(self):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            status = self._fail_next.pop(0) if self._fail_next else None
+            if status is None and self._random.random() < self.error_rate:
+                status = 429
+            if status is not None:
+                self.errors += 1
+                raise api_error(status, "Quota exceeded for quota metric 'Read requests'")
+            return [list(row) for row in self.values]
+
+    @property
+    def row_count(self):
+        return len(self.values)
+
+    @property
+    def col_count(self):
+        return max((len(row) for row in self.values), default=0)
+
+    def get_values(self):
+        values = self._request()
+        width = self.col_count
+        return [row + [""] * (width - len(row)) for row in values]
+
+    # Supports the "1:1", "A<row>:<col>" and "A<row>:<col><row>" ranges used by GSheetSource
+    def batch_get(self, ranges):
+        values = self._request()
+        result = []
+        for name in ranges:
+            rows = re.fullmatch(r"(\d+):(\d+)", name)
+            if rows:
+                result.append(values[int(rows.group(1)) - 1:int(rows.group(2))])
+                continue
+            start, stop = re.fullmatch(r"A(\d+):[A-Z]+(\d*)", name).groups()
+            result.append(values[int(start) - 1:int(stop) if stop else None])
+        return result
+
+    def col_values(self, col):
+        column = [row[col - 1] if len(row) >= col else "" for row in self._request()]
+        while column and column[-1] == "":
+            column.pop()
+        return column
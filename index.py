@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+# Columns behind the Area / Vendor / Store selectors
+FILTER_COLUMNS = ["ภาค", "ผู้รับเหมา", "รหัสร้าน"]
+
+EMPTY = np.empty(0, dtype=np.intp)
+
+
+# The values a filter selects: a filter is one value or a list/tuple of them
+def as_values(selection):
+    return list(selection) if isinstance(selection, (list, tuple, set, frozenset)) else [selection]
+
+
+# Row bounds [lo, hi) of start <= column < end. Frames are kept sorted by
+# time, so this is two binary searches rather than a scan.
+def time_bounds(df, start, end, column="เวลา"):
+    times = df[column]
+    lo = 0 if start is None else times.searchsorted(pd.Timestamp(start), side="left")
+    hi = len(df) if end is None else times.searchsorted(pd.Timestamp(end), side="left")
+    return lo, hi
+
+
+# Categorical codes of one column plus, for every distinct value, the sorted
+# row positions holding it
+class ColumnIndex:
+    def __init__(self, values, lookup, codes, positions):
+        self.values = values  # code -> value
+        self.lookup = lookup  # value -> code
+        self.codes = codes
+        self.positions = positions  # code -> sorted row positions
+
+    @classmethod
+    def build(cls, column):
+        codes, uniques = pd.factorize(column, sort=True)
+        codes = codes.astype(np.int32)
+        values = list(uniques)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(values) + 1))
+        positions = [order[bounds[i]:bounds[i + 1]] for i in range(len(values))]
+        return cls(values, {v: i for i, v in enumerate(values)}, codes, positions)
+
+    # New index with rows appended at positions offset, offset+1, ...
+    def extend(self, column, offset):
+        values, lookup, positions = list(self.values), dict(self.lookup), list(self.positions)
+        codes, uniques = pd.factorize(column)
+        mapping = np.empty(len(uniques), dtype=np.int32)
+        for j, value in enumerate(uniques):
+            if value not in lookup:
+                lookup[value] = len(values)
+                values.append(value)
+                positions.append(EMPTY)
+            code = mapping[j] = lookup[value]
+            positions[code] = np.concatenate([positions[code], offset + np.flatnonzero(codes == j)])
+        new_codes = np.where(codes < 0, -1, mapping[codes]).astype(np.int32)
+        return ColumnIndex(values, lookup, np.concatenate([self.codes, new_codes]), positions)
+
+    def rows(self, value):
+        code = self.lookup.get(value)
+        return EMPTY if code is None else self.positions[code]
+
+    # Codes of the given values that occur in the column
+    def codes_of(self, values):
+        return np.array([self.lookup[v] for v in values if v in self.lookup], dtype=np.int32)
+
+
+# Row-position index over the filter columns. Columns filtered on a single
+# value are resolved by intersecting their position lists; columns filtered
+# on several values by one np.isin pass over their codes, restricted to the
+# rows left by the other filters.
+class FilterIndex:
+    def __init__(self, df=None, columns=None):
+        if columns is None:
+            columns = {col: ColumnIndex.build(df[col]) for col in FILTER_COLUMNS if col in df}
+        self.columns = columns
+
+    def extend(self, new, offset):
+        return FilterIndex(columns={col: ix.extend(new[col], offset) for col, ix in self.columns.items()})
+
+    # Positions of the rows in [lo, hi) matching every {column: value or
+    # values} filter; a plain slice when there are no filters
+    def lookup(self, filters, lo, hi):
+        if not filters:
+            return slice(lo, hi)
+        candidates, memberships = [], []
+        for col, selection in filters.items():
+            ix = self.columns[col]
+            codes = ix.codes_of(as_values(selection))
+            if len(codes) == 0:
+                return EMPTY
+            if len(codes) == 1:
+                rows = ix.positions[codes[0]]
+                candidates.append(rows[np.searchsorted(rows, lo):np.searchsorted(rows, hi)])
+            else:
+                memberships.append((ix.codes, codes))
+        if candidates:
+            candidates.sort(key=len)
+            rows = candidates[0]
+            for other in candidates[1:]:
+                rows = np.intersect1d(rows, other, assume_unique=True)
+            for codes, wanted in memberships:
+                rows = rows[np.isin(codes[rows], wanted)]
+            return rows
+        mask = np.isin(memberships[0][0][lo:hi], memberships[0][1])
+        for codes, wanted in memberships[1:]:
+            mask &= np.isin(codes[lo:hi], wanted)
+        return lo + np.flatnonzero(mask)
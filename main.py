@@ -1,68 +1,164 @@
 import streamlit as st
-import gspread
-from google.oauth2.service_account import Credentials
 import pandas as pd
 import plotly.graph_objects as go
 import calendar
 import datetime
-
-# Load credentials from JSON key file
-scopes = ["https://www.googleapis.com/auth/spreadsheets"]
-creds = Credentials.from_service_account_file("credentials.json", scopes=scopes)
-client = gspread.authorize(creds)
-
-sheet_id = '1WpsBMMpp9KC3YYhySeAq1ZQ9mp5KFOrrlJlm-zqttb4'
-sheet = client.open_by_key(sheet_id).sheet1  # Open the first sheet in the Google Sheet
-
-# Function to get data based on the selected part, eng, store_id, and date
-def get_data(part, eng, store_id, selected_date):
-    data = sheet.get_all_records()
-    df = pd.DataFrame(data)
-    df["รหัสร้าน"] = df["รหัสร้าน"].astype(str)
-    if part != "ทั้งหมด":
-        df = df[df["ภาค"] == part]
-    if eng != "ทั้งหมด":
-        df = df[df["ผู้รับเหมา"] == eng]
-    if store_id != "ทั้งหมด":
-        df = df[df["รหัสร้าน"] == store_id]
-    if selected_date:
-        df = df[df["เวลา"].str.contains(selected_date)]
-    return df
+from store import DataStore, day_range, month_range
+from sync import SheetSync
+from snapshot import SnapshotStore
+from sources import open_source
+from reports import PARTS, FREQUENCIES, COMPLIANCE, VENDOR_ORDER, overview, group_totals, monthly_report, trend, sort_vendors, top_vendors, paginate, sort_rows, overview_csv, monthly_html, hotspots
+from rolling import LEVELS, WINDOWS, DROP, DROP_POINTS, MIN_CHECKED
+from metrics import Metrics, MeteredSource, METRICS_PORT
+from quota import QuotaSource
+from results import ResultCache
+from charts import group_chart, trend_chart
+
+# Timing samples and counters for the whole server
+@st.cache_resource
+def get_metrics():
+    metrics = Metrics()
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT)
+    return metrics
+
+# Timings of this rerun, shown in the debug panel
+metrics = get_metrics()
+trace = metrics.trace()
+
+# The data source chosen by HELMET_SOURCE (the Google Sheet by default). It
+# is created once per server, only connects on first data access, and keeps
+# its reads within the API quota.
+@st.cache_resource
+def get_source():
+    metrics = get_metrics()
+    return MeteredSource(QuotaSource(open_source(metrics=metrics), metrics), metrics)
+
+# One cached copy of the sheet for the whole server, shared by all sessions
+# and kept up to date by a single background poller
+@st.cache_resource
+def get_store():
+    store = DataStore(SheetSync(get_source()), SnapshotStore())
+    store.start_polling()
+    return store
+
+# Progress bar for a blocking download of the whole sheet; returns the
+# callback the store reports to and the placeholder to clear afterwards
+def progress_bar(label):
+    placeholder = st.empty()
+    def show(done, total):
+        fraction = done / total if total else 1.0
+        placeholder.progress(min(fraction, 1.0), text=f"{label}: {done:,} / {total:,} rows")
+    return show, placeholder
+
+# Page results shared by all sessions, dropped when a new data version arrives
+@st.cache_resource
+def get_results():
+    return ResultCache(metrics=get_metrics())
+
+# Vendor rows as shown: compliance as a percentage
+def vendor_view(vendors):
+    view = vendors.copy()
+    view[COMPLIANCE] = (view[COMPLIANCE] * 100).round(1)
+    return view.rename(columns={COMPLIANCE: COMPLIANCE + " (%)"})
+
+# Function to turn the selected parts, engs and store_ids into index
+# filters; nothing selected means no filter on that column
+def get_filters(parts, engs, store_ids):
+    filters = {}
+    if parts:
+        filters["ภาค"] = tuple(parts)
+    if engs:
+        filters["ผู้รับเหมา"] = tuple(engs)
+    if store_ids:
+        filters["รหัสร้าน"] = tuple(store_ids)
+    return filters
+
+# Selected values as shown in the summaries, "ทั้งหมด" when nothing is selected
+def selection_label(values):
+    return ", ".join(values) or "ทั้งหมด"
 
 # Streamlit app
 st.title("Safty-CAFM")
 
 # Add a sidebar for navigation
-page = st.sidebar.selectbox("Select Page", ["ข้อมูลรวม", "ตรวจสอบตาม Area", "ตรวจสอบตาม ผู้รับเหมา", "รายงานรายเดือน"])
-
-# Get the list of parts from the Google Sheet
-engs = sheet.col_values(5)[1:]
-engs = list(set(engs))
-
-store_ids = sheet.col_values(4)[1:]
-store_ids = list(set(store_ids))
-
-parts = ['BE', 'BG', 'BN', 'BS', 'BW', 'NEL', 'REL', 'RSL', 'RC', 'RN', 'NEU', 'REU', 'RSU']
+page = st.sidebar.selectbox("Select Page", ["ข้อมูลรวม", "ตรวจสอบตาม Area", "ตรวจสอบตาม ผู้รับเหมา", "รายงานรายเดือน", "รายงานช่วงเวลา", "จุดเสี่ยง"])
+
+# Manual refresh reloads the whole sheet before this rerun reads it; if that
+# fails the data already loaded stays on screen
+if st.sidebar.button("Refresh data now"):
+    show_progress, placeholder = progress_bar("Reloading inspections")
+    try:
+        get_store().reload(show_progress)
+    except Exception as e:
+        st.sidebar.warning(f"Refresh failed, showing the previous data: {e}")
+    placeholder.empty()
+show_timings = st.sidebar.checkbox("Show timings")
+
+# Current version of the data, shared by every page of this rerun. Only the
+# very first load can fail here; later sync errors keep the last good data.
+show_progress, placeholder = progress_bar("Loading inspections")
+try:
+    data = get_store().get(show_progress)
+except Exception as e:
+    st.error(f"Could not load the inspection data: {e}")
+    st.stop()
+placeholder.empty()
+trace.lap("data")
+
+# Filter options come from the loaded data, sorted once per data version
+engs = data.options("ผู้รับเหมา")
+store_ids = data.options("รหัสร้าน")
+trace.lap("filter_options")
+
+parts = PARTS
 
 # Multiple selector for parts
-selected_part = st.selectbox("เลือก Area", ["ทั้งหมด"] + parts)
+selected_parts = st.multiselect("เลือก Area", parts, help="ว่างไว้ = ทั้งหมด")
 # Multiple selector for engs
-selected_eng = st.selectbox("เลือก Vendor", ["ทั้งหมด"] + engs)
+selected_engs = st.multiselect("เลือก Vendor", engs, help="ว่างไว้ = ทั้งหมด")
 # Multiple selector for store_id
-selected_store_id = st.selectbox("เลือก รหัสร้าน", ["ทั้งหมด"] + store_ids)
+selected_store_ids = st.multiselect("เลือก รหัสร้าน", store_ids, help="ว่างไว้ = ทั้งหมด")
+selected_part = selection_label(selected_parts)
+selected_eng = selection_label(selected_engs)
+selected_store_id = selection_label(selected_store_ids)
 
 # Date input widget
 selected_date = st.date_input("Select Date")
 
-# Get data based on the selected part and date
-df = get_data(selected_part, selected_eng, selected_store_id, selected_date.strftime("%Y-%m-%d"))
+# Index filters for the selected parts, engs and store_ids
+filters = get_filters(selected_parts, selected_engs, selected_store_ids)
+results = get_results()
+trace.lap("widgets")
+
+# Cache status
+store = get_store()
+st.sidebar.caption(f"Cache hits: {store.hits} | misses: {store.misses} | age: {store.age() or 0:.0f}s (TTL {store.ttl}s)")
+st.sidebar.caption(f"Data version {data.version}{' (refreshing)' if store.is_refreshing() else ''} | served from: {store.source} | sheet syncs: {store.sync.incremental_syncs} incremental, {store.sync.full_reloads} full ({store.sync.edit_reloads} after edits) | rows fetched: {store.sync.rows_fetched}")
+st.sidebar.caption(f"Result cache: {results.hits} hits, {results.misses} misses, {results.evictions} evicted, {results.invalidations} invalidated | {len(results)} entries, {results.bytes / 2**20:.1f} of {results.max_bytes / 2**20:.0f} MB")
+report = store.sync.report
+memory = f"Memory: {data.footprint() / 2**20:.1f} MB for {len(data.df):,} rows"
+if report.rows:
+    memory += f" | last ingest {report.text_bytes / 2**20:.1f} MB as text, {report.typed_bytes / 2**20:.1f} MB typed"
+st.sidebar.caption(memory)
+if report.invalid:
+    st.sidebar.caption("Invalid rows: " + ", ".join(f"{count:,} {rule}" for rule, count in report.invalid.items()))
+download = store.progress
+if download is not None:
+    st.sidebar.caption(f"Downloading the sheet in the background: {download[0]:,} / {download[1]:,} rows")
+if store.last_error is not None:
+    st.sidebar.warning(f"Last sync failed, showing the previous data: {store.last_error}")
 
 if page == "ข้อมูลรวม":
+    # Get data based on the selected part and date
+    df, totals = results.call(overview, data, filters, *day_range(selected_date))
+    trace.lap("aggregate")
+
     # Display the data
     if selected_part != "ทั้งหมด" or selected_eng or selected_store_id:
-        helmet_count = df["จำนวนคนใส่หมวก"].sum()
-        no_helmet_count = df["คนไม่ใส่หมวก"].sum()
-        person_count = df["คนทั้งหมด"].sum()
+        helmet_count = totals["จำนวนคนใส่หมวก"]
+        no_helmet_count = totals["คนไม่ใส่หมวก"]
+        person_count = totals["คนทั้งหมด"]
         html_content = f"""
         <!DOCTYPE html>
         <html lang="th">
@@ -158,37 +254,38 @@ if page == "ข้อมูลรวม":
         </html>
         """
         st.markdown(html_content, unsafe_allow_html=True)
-    st.write(df)
 
-elif page == "ตรวจสอบตาม Area":
-    if not df.empty:
-        df_part = df.groupby("ภาค").sum().reset_index()
-
-        fig = go.Figure()
-
-        fig.add_trace(go.Bar(
-            x=df_part["ภาค"],
-            y=df_part["จำนวนคนใส่หมวก"],
-            name='จำนวนคนใส่หมวก',
-            textposition='outside'
-        ))
+    # Matching rows, sorted here and sent to the browser one page at a time
+    columns = st.multiselect("Columns", list(df.columns), default=list(df.columns))
+    sort_col, order_col, size_col = st.columns(3)
+    sort_by = sort_col.selectbox("Sort by", list(df.columns))
+    descending = order_col.checkbox("Descending")
+    page_size = size_col.selectbox("Rows per page", [50, 100, 500])
+    row_page = st.number_input("Row page", min_value=1, value=1, step=1)
+    rows, pages = paginate(sort_rows(df, sort_by, not descending), row_page, page_size)
+    st.dataframe(rows[columns or list(df.columns)], hide_index=True)
+    st.caption(f"Page {min(row_page, pages)} of {pages} | {len(df):,} rows")
+    trace.lap("table")
+
+    # The full filtered set as CSV, encoded only when asked for
+    if st.button("Prepare CSV download"):
+        st.download_button(
+            "Download CSV",
+            results.call(overview_csv, data, filters, *day_range(selected_date)),
+            file_name=f"helmet_{selected_date:%Y%m%d}.csv",
+            mime="text/csv",
+        )
 
-        fig.add_trace(go.Bar(
-            x=df_part["ภาค"],
-            y=df_part["คนไม่ใส่หมวก"],
-            name='คนไม่ใส่หมวก',
-            textposition='outside'
-        ))
+elif page == "ตรวจสอบตาม Area":
+    # Totals per group come from the daily rollup cube, not the raw rows
+    df_part = results.call(group_totals, data, "ภาค", filters, *day_range(selected_date))
+    trace.lap("aggregate")
+    if not df_part.empty:
 
-        fig.update_layout(
-            barmode='group',
-            title="จำนวนการใส่หมวกตาม Area",
-            xaxis_title="Part",
-            yaxis_title="Count",
-            legend_title="Type",
-            dragmode="pan"
-        )
+        # Figure spec cached per data version and filters; at most TOP_N bars
+        fig = results.call(group_chart, data, "ภาค", filters, *day_range(selected_date), "จำนวนการใส่หมวกตาม Area")
 
+        trace.lap("figure")
         st.plotly_chart(fig)
 
         helmet_count = df_part["จำนวนคนใส่หมวก"].sum()
@@ -300,34 +397,15 @@ elif page == "ตรวจสอบตาม Area":
         st.write("No data available for the selected filters.")
 
 elif page == "ตรวจสอบตาม ผู้รับเหมา":
-    if not df.empty:
-        df_part = df.groupby("ผู้รับเหมา").sum().reset_index()
+    # Totals per group come from the daily rollup cube, not the raw rows
+    df_part = results.call(group_totals, data, "ผู้รับเหมา", filters, *day_range(selected_date))
+    trace.lap("aggregate")
+    if not df_part.empty:
 
-        fig = go.Figure()
-
-        fig.add_trace(go.Bar(
-            x=df_part["ผู้รับเหมา"],
-            y=df_part["จำนวนคนใส่หมวก"],
-            name='จำนวนคนใส่หมวก',
-            textposition='outside'
-        ))
-
-        fig.add_trace(go.Bar(
-            x=df_part["ผู้รับเหมา"],
-            y=df_part["คนไม่ใส่หมวก"],
-            name='คนไม่ใส่หมวก',
-            textposition='outside'
-        ))
-
-        fig.update_layout(
-            barmode='group',
-            title="จำนวนการใส่หมวกตาม ผู้รับเหมา",
-            xaxis_title="Part",
-            yaxis_title="Count",
-            legend_title="Type",
-            dragmode="pan"
-        )
+        # Figure spec cached per data version and filters; at most TOP_N bars
+        fig = results.call(group_chart, data, "ผู้รับเหมา", filters, *day_range(selected_date), "จำนวนการใส่หมวกตาม ผู้รับเหมา")
 
+        trace.lap("figure")
         st.plotly_chart(fig)
         helmet_count = df_part["จำนวนคนใส่หมวก"].sum()
         no_helmet_count = df_part["คนไม่ใส่หมวก"].sum()
@@ -440,33 +518,22 @@ elif page == "ตรวจสอบตาม ผู้รับเหมา":
 elif page == "รายงานรายเดือน":
     current_date = datetime.datetime.now()
     default_month = current_date.month
-    default_year = current_date.year
+    # Years offered are the ones present in the data, latest by default
+    years = data.years()
+    default_year = current_date.year if current_date.year in years else years[-1]
     selected_month = st.sidebar.selectbox("Select Month", range(1, 13), index=default_month - 1)
-    selected_year = st.sidebar.selectbox("Select Year", range(2020, 2025), index=default_year - 2020)
+    selected_year = st.sidebar.selectbox("Select Year", years, index=years.index(default_year))
 
     # Get the data for the selected month
-    month_start = f"{selected_year}-{selected_month:02d}-01"
-    month_end = f"{selected_year}-{selected_month:02d}-{calendar.monthrange(selected_year, selected_month)[1]}"
-    df_month = get_data(selected_part, selected_eng, selected_store_id, "")
-    df_month = df_month[(df_month["เวลา"] >= month_start) & (df_month["เวลา"] <= month_end)]
-
-    if not df_month.empty:
-        helmet_count = df_month["จำนวนคนใส่หมวก"].sum()
-        no_helmet_count = df_month["คนไม่ใส่หมวก"].sum()
-        person_count = df_month["คนทั้งหมด"].sum()
-       
-        
-        # Insights
-        total_days = df_month["เวลา"].nunique()
-        average_helmet_per_day = helmet_count / total_days
-        average_no_helmet_per_day = no_helmet_count / total_days
+    report = results.call(monthly_report, data, filters, *month_range(selected_year, selected_month))
+    trace.lap("aggregate")
+
+    if report is not None:
+        helmet_count = report["helmet_count"]
+        no_helmet_count = report["no_helmet_count"]
 
         # Vendor-wise analysis
-        vendor_analysis = df_month.groupby("ผู้รับเหมา").agg({
-            "จำนวนคนใส่หมวก": "sum",
-            "คนไม่ใส่หมวก": "sum",
-            "คนทั้งหมด": "sum"
-        }).reset_index()
+        vendor_analysis = report["vendor_analysis"]
 
         # Display the data
         st.write(f"### Monthly Report for {calendar.month_name[selected_month]} {selected_year}")
@@ -482,103 +549,90 @@ elif page == "รายงานรายเดือน":
             marker_color=["#8bd49c", "#ff7f7f"],
         ))
         fig.update_layout(title_text='Monthly Helmet Usage Statistics')
+        trace.lap("figure")
         st.plotly_chart(fig)
 
         # HTML and CSS for insights and summary
-        html_content = f"""
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Monthly Report</title>
-            <style>
-                body {{
-                    font-family: Arial, sans-serif;
-                    background-color: #f0f0f0;
-                    padding: 20px;
-                }}
-                .report {{
-                    background-color: #ffffff;
-                    padding: 30px;
-                    border-radius: 20px;
-                    box-shadow: 0 0 10px rgba(0, 0, 0, 0.1);
-                    text-align: center;
-                    max-width: 800px;
-                    margin: auto;
-                }}
-                .report h1 {{
-                    color: #333333;
-                    font-size: 2em;
-                    margin: 0 0 20px;
-                }}
-                .summary {{
-                    display: flex;
-                    flex-wrap: wrap;
-                    justify-content: space-around;
-                    margin-bottom: 20px;
-                }}
-                .summary div {{
-                    background-color: #f0f0f0;
-                    padding: 20px;
-                    border-radius: 10px;
-                    margin: 10px;
-                    text-align: center;
-                    flex: 1 1 calc(33% - 40px);
-                    box-shadow: 0 0 5px rgba(0, 0, 0, 0.1);
-                }}
-                .summary div h2 {{
-                    margin: 0;
-                    font-size: 1.5em;
-                    color: #555555;
-                }}
-                .summary div p {{
-                    margin: 10px 0 0;
-                    font-size: 1.2em;
-                    color: #777777;
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="report">
-                <h1>รายงานประจำเดือน {calendar.month_name[selected_month]} {selected_year}</h1>
-                <div class="summary">
-                    <div>
-                        <h2>จำนวนคนใส่หมวก</h2>
-                        <p>{helmet_count} คน</p>
-                    </div>
-                    <div>
-                        <h2>จำนวนคนไม่ใส่หมวก</h2>
-                        <p>{no_helmet_count} คน</p>
-                    </div>
-                    <div>
-                        <h2>จำนวนคนทั้งหมด</h2>
-                        <p>{person_count} คน</p>
-                    </div>
-                    <div>
-                        <h2>เฉลี่ยจำนวนคนใส่หมวกต่อวัน</h2>
-                        <p>{average_helmet_per_day:.2f} คน</p>
-                    </div>
-                    <div>
-                        <h2>เฉลี่ยจำนวนคนไม่ใส่หมวกต่อวัน</h2>
-                        <p>{average_no_helmet_per_day:.2f} คน</p>
-                    </div>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+        html_content = monthly_html(report, selected_year, selected_month)
 
         # Vendor Analysis
         
         st.markdown(html_content , unsafe_allow_html=True)
         st.write(f"#### Vendor-wise Analysis:")
-        for index, row in vendor_analysis.iterrows():
-            st.write(f"##### ผู้รับเหมา: {row['ผู้รับเหมา']}")
-            st.write(f"จำนวนคนใส่หมวก: {row['จำนวนคนใส่หมวก']} คน")
-            st.write(f"จำนวนคนไม่ใส่หมวก: {row['คนไม่ใส่หมวก']} คน")
-            st.write(f"จำนวนคนทั้งหมด: {row['คนทั้งหมด']} คน")
-            st.write("---")  # Separator between vendors
 
+        # Best and worst vendors by compliance
+        top_k = st.selectbox("Top vendors", [5, 10, 20])
+        worst_col, best_col = st.columns(2)
+        worst_col.write("Lowest compliance")
+        worst_col.dataframe(vendor_view(top_vendors(vendor_analysis, top_k)), hide_index=True)
+        best_col.write("Highest compliance")
+        best_col.dataframe(vendor_view(top_vendors(vendor_analysis, top_k, worst=False)), hide_index=True)
+
+        # Every vendor, sorted here and sent to the browser one page at a time
+        order = st.selectbox("Sort vendors by", list(VENDOR_ORDER))
+        page_size = st.selectbox("Vendors per page", [25, 50, 100])
+        vendor_page = st.number_input("Vendor page", min_value=1, value=1, step=1)
+        rows, pages = paginate(sort_vendors(vendor_analysis, order), vendor_page, page_size)
+        st.dataframe(vendor_view(rows), hide_index=True)
+        st.caption(f"Page {min(vendor_page, pages)} of {pages} | {len(vendor_analysis)} vendors")
+        trace.lap("vendor_table")
+
+    else:
+        st.write(f"No data available for {calendar.month_name[selected_month]} {selected_year}.")
+
+elif page == "รายงานช่วงเวลา":
+    # Any date range within the data, the last 90 days of it by default
+    span = data.span()
+    last_day = span[1].date() if span else datetime.date.today()
+    first_day = span[0].date() if span else last_day
+    default_start = max(first_day, last_day - datetime.timedelta(days=89))
+    selected_range = st.date_input("Select Date Range", (default_start, last_day), min_value=first_day, max_value=last_day)
+    frequency = st.radio("Trend", list(FREQUENCIES), index=1, horizontal=True)
+    group_by = st.selectbox("Compare by", ["ทั้งหมด", "ภาค", "ผู้รับเหมา"])
+
+    if len(selected_range) < 2:
+        st.write("Select the last day of the range.")
+    else:
+        start, end = selected_range[0], selected_range[1] + datetime.timedelta(days=1)
+        column = None if group_by == "ทั้งหมด" else group_by
+        table = results.call(trend, data, column, filters, start, end, frequency)
+        trace.lap("aggregate")
+
+        if not table.empty:
+            st.write(f"### Helmet compliance {selected_range[0]:%d %b %Y} - {selected_range[1]:%d %b %Y}")
+            # Lines per group, or a heatmap when there are many groups
+            fig = results.call(trend_chart, data, column, filters, start, end, frequency, group_by)
+            trace.lap("figure")
+            st.plotly_chart(fig)
+        else:
+            st.write("No data available for the selected range and filters.")
+
+elif page == "จุดเสี่ยง":
+    # Worst stores, vendors or areas by rolling compliance, and sudden drops
+    level = st.selectbox("Rank", LEVELS)
+    window = st.radio("Window (days)", list(WINDOWS), horizontal=True)
+    k = st.number_input("Top K", min_value=1, value=20, step=5)
+    worst, drops = results.call(hotspots, data, level, filters, window, k)
+    trace.lap("aggregate")
+
+    as_of = data.rolling().as_of
+    if as_of is None:
+        st.write("No data available.")
     else:
-        st.write(f"No data available for {calendar.month_name[selected_month]} {selected_year}.")
\ No newline at end of file
+        st.write(f"### Lowest {window}-day helmet compliance by {level} as of {as_of:%d %b %Y}")
+        st.caption(f"Ranked when at least {MIN_CHECKED} people were checked in the window")
+        st.dataframe(worst.drop(columns=DROP), hide_index=True)
+        st.write(f"### Sudden drops ({len(drops)})")
+        st.caption(f"7-day rate at least {DROP_POINTS:g} points below the 30-day rate, with at least {MIN_CHECKED} people checked in the last 7 days")
+        st.dataframe(drops.drop(columns=DROP), hide_index=True)
+        trace.lap("table")
+
+trace.lap("render")
+
+# Debug panel with the timings of this rerun
+if show_timings:
+    timings = pd.DataFrame(trace.spans, columns=["stage", "seconds"])
+    timings["ms"] = (timings.pop("seconds") * 1000).round(1)
+    st.sidebar.table(timings)
+    st.sidebar.caption(f"Rerun total: {trace.total() * 1000:.0f} ms")
+trace.finish()
\ No newline at end of file
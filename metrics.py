@@ -0,0 +1,198 @@
+import collections
+import http.server
+import os
+import threading
+import time
+
+import numpy as np
+
+from sources import DataSource
+
+# Prometheus text exposition of the dashboard timings, rewritten at most once
+# a second; set HELMET_METRICS_PORT to also serve it over HTTP at /metrics
+METRICS_FILE = os.environ.get("HELMET_METRICS_FILE", "metrics.prom")
+METRICS_PORT = os.environ.get("HELMET_METRICS_PORT")
+
+QUANTILES = [0.5, 0.9, 0.99]
+WINDOW = 1000  # latest samples kept per series for the quantiles
+
+# family -> (metric name, label name, help)
+SUMMARIES = {
+    "stage": ("helmet_stage_seconds", "stage", "Time spent in each stage of a dashboard rerun"),
+    "sheet": ("helmet_sheet_request_seconds", "method", "Latency of data source requests"),
+    "connect": ("helmet_sheet_connect_seconds", "phase", "Time to authorize, open the sheet and renew the access token"),
+}
+COUNTERS = {
+    "reruns": ("helmet_reruns_total", None, "Dashboard reruns"),
+    "sheet_requests": ("helmet_sheet_requests_total", "method", "Data source requests"),
+    "sheet_bytes": ("helmet_sheet_bytes_total", "method", "Approximate bytes of cell data fetched from the data source"),
+    "sheet_retries": ("helmet_sheet_retries_total", "reason", "Data source requests retried after a 429, 5xx or network error"),
+    "sheet_coalesced": ("helmet_sheet_coalesced_total", "method", "Reads answered by an identical request already in flight"),
+    "quota_wait": ("helmet_sheet_quota_wait_seconds_total", None, "Time spent waiting for the read budget"),
+    "result_cache": ("helmet_result_cache_events_total", "event", "Page result cache hits, misses, evictions and invalidated entries"),
+}
+
+_current = threading.local()
+
+
+# Process-wide timing samples and counters
+class Metrics:
+    def __init__(self, path=METRICS_FILE):
+        self.path = path
+        self.samples = collections.defaultdict(lambda: collections.deque(maxlen=WINDOW))
+        self.sums = collections.defaultdict(float)
+        self.counts = collections.defaultdict(int)
+        self.counters = collections.defaultdict(float)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._written_at = 0
+
+    def observe(self, family, label, seconds):
+        with self._lock:
+            self.samples[family, label].append(seconds)
+            self.sums[family, label] += seconds
+            self.counts[family, label] += 1
+
+    def inc(self, family, label=None, value=1):
+        with self._lock:
+            self.counters[family, label] += value
+
+    # New timing trace for a rerun, also made current for this thread
+    def trace(self):
+        _current.trace = Trace(self)
+        return _current.trace
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for family, (name, label_name, help_text) in SUMMARIES.items():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} summary"]
+                for (fam, label), samples in sorted(self.samples.items()):
+                    if fam != family:
+                        continue
+                    values = np.quantile(np.array(samples), QUANTILES)
+                    for q, v in zip(QUANTILES, values):
+                        lines.append(f'{name}{{{label_name}="{label}",quantile="{q}"}} {v:.6f}')
+                    lines.append(f'{name}_sum{{{label_name}="{label}"}} {self.sums[fam, label]:.6f}')
+                    lines.append(f'{name}_count{{{label_name}="{label}"}} {self.counts[fam, label]}')
+            for family, (name, label_name, help_text) in COUNTERS.items():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for (fam, label), value in sorted(self.counters.items(), key=lambda kv: (kv[0][0], str(kv[0][1]))):
+                    if fam != family:
+                        continue
+                    labels = f'{{{label_name}="{label}"}}' if label_name else ""
+                    lines.append(f"{name}{labels} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    # Rewrite the metrics file, at most once a second. One thread writes at
+    # a time; a failed write is skipped rather than failing the rerun.
+    def write(self, force=False):
+        if not self.path:
+            return
+        with self._write_lock:
+            if not force and time.monotonic() - self._written_at < 1:
+                return
+            self._written_at = time.monotonic()
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(self.render())
+                os.replace(tmp, self.path)
+            except OSError:
+                pass
+
+    # Serve the metrics at http://<host>:port/metrics from a daemon thread
+    def serve(self, port):
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode("utf-8")
+                self.send_response(200 if self.path == "/metrics" else 404)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            server = http.server.ThreadingHTTPServer(("", int(port)), Handler)
+        except OSError:
+            return None  # port taken, e.g. by an earlier copy of this process's metrics
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+# Timings of one rerun. lap(stage) charges the time since the previous lap
+# to stage, so a script can be instrumented without re-indenting its blocks.
+class Trace:
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.spans = []
+        self.started = self._last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.add(stage, now - self._last)
+        self._last = now
+
+    def add(self, stage, seconds, family="stage"):
+        self.spans.append((stage, seconds))
+        self.metrics.observe(family, stage, seconds)
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def finish(self):
+        self.metrics.observe("stage", "rerun", self.total())
+        self.metrics.inc("reruns")
+        _current.trace = None
+        self.metrics.write()
+
+
+def _size(rows):
+    return sum(len(cell.encode("utf-8")) for row in rows for cell in row)
+
+
+# DataSource wrapper timing every request and counting the bytes fetched.
+# Requests made while a rerun is being traced also show up in its trace.
+class MeteredSource(DataSource):
+    def __init__(self, source, metrics):
+        self.source = source
+        self.metrics = metrics
+
+    def _call(self, method, *args):
+        started = time.perf_counter()
+        result = getattr(self.source, method)(*args)
+        seconds = time.perf_counter() - started
+        self.metrics.observe("sheet", method, seconds)
+        self.metrics.inc("sheet_requests", method)
+        trace = getattr(_current, "trace", None)
+        if trace is not None:
+            trace.spans.append((f"sheet.{method}", seconds))
+        return result
+
+    def values(self):
+        values = self._call("values")
+        self.metrics.inc("sheet_bytes", "values", _size(values))
+        return values
+
+    def tail(self, start):
+        header, rows = self._call("tail", start)
+        self.metrics.inc("sheet_bytes", "tail", _size([header]) + _size(rows))
+        return header, rows
+
+    def rows(self, start, stop):
+        header, rows = self._call("rows", start, stop)
+        self.metrics.inc("sheet_bytes", "rows", _size([header]) + _size(rows))
+        return header, rows
+
+    def col_values(self, col):
+        values = self._call("col_values", col)
+        self.metrics.inc("sheet_bytes", "col_values", _size([values]))
+        return values
+
+    def row_count(self):
+        return self._call("row_count")
@@ -0,0 +1,136 @@
+import concurrent.futures
+import os
+import random
+import threading
+import time
+
+import gspread
+import requests
+
+from sources import DataSource
+
+# Read budget for the Sheets API; Google's default quota is 60 reads per
+# minute per user
+READS_PER_MINUTE = int(os.environ.get("HELMET_READS_PER_MINUTE", "60"))
+MAX_RETRIES = 5
+BASE_DELAY = 1.0  # seconds before the first retry, doubled on every attempt
+MAX_DELAY = 32.0
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+# Why a failed request may be retried ("429", "5xx", "network"), or None
+def retry_reason(exc):
+    if isinstance(exc, gspread.exceptions.APIError):
+        status = exc.response.status_code
+        if status == 429:
+            return "429"
+        return "5xx" if status in RETRY_STATUS else None
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return "network"
+    return None
+
+
+# Token bucket refilled continuously at rate_per_minute; acquire() waits for a token
+class TokenBucket:
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    # Take one token, sleeping until one is available; returns the seconds waited
+    def acquire(self):
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+# DataSource wrapper that keeps reads within the quota. Identical concurrent
+# reads share one request, every request takes a token from the read budget,
+# and 429 / 5xx / network failures are retried with jittered exponential
+# backoff. Errors left after the last retry are raised to the caller; the
+# store then keeps serving its last good version.
+class QuotaSource(DataSource):
+    def __init__(self, source, metrics=None, reads_per_minute=READS_PER_MINUTE,
+                 max_retries=MAX_RETRIES, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+        self.source = source
+        self.metrics = metrics
+        self.bucket = TokenBucket(reads_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.coalesced = 0
+        self.retries = 0
+        self.throttled = 0  # 429 responses
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _inc(self, family, label=None, value=1):
+        if self.metrics is not None:
+            self.metrics.inc(family, label, value)
+
+    def _read(self, method, *args):
+        key = (method, args)
+        with self._lock:
+            call = self._in_flight.get(key)
+            owner = call is None
+            if owner:
+                call = self._in_flight[key] = concurrent.futures.Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            self._inc("sheet_coalesced", method)
+            return call.result()
+        try:
+            result = self._with_retries(method, *args)
+            call.set_result(result)
+            return result
+        except BaseException as exc:
+            call.set_exception(exc)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def _with_retries(self, method, *args):
+        for attempt in range(self.max_retries + 1):
+            waited = self.bucket.acquire()
+            if waited:
+                self._inc("quota_wait", value=waited)
+            try:
+                return getattr(self.source, method)(*args)
+            except Exception as exc:
+                reason = retry_reason(exc)
+                if reason == "429":
+                    self.throttled += 1
+                if reason is None or attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                self._inc("sheet_retries", reason)
+                time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+    def values(self):
+        return self._read("values")
+
+    def tail(self, start):
+        return self._read("tail", start)
+
+    def rows(self, start, stop):
+        return self._read("rows", start, stop)
+
+    def col_values(self, col):
+        return self._read("col_values", col)
+
+    def row_count(self):
+        return self._read("row_count")
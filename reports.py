@@ -0,0 +1,230 @@
+import calendar
+import codecs
+
+import pandas as pd
+
+from cube import DAY
+from schema import COUNT_COLUMNS
+
+# Areas offered by the Area selector
+PARTS = ['BE', 'BG', 'BN', 'BS', 'BW', 'NEL', 'REL', 'RSL', 'RC', 'RN', 'NEU', 'REU', 'RSU']
+
+# Trend granularity -> pandas frequency; weeks start on Monday
+FREQUENCIES = {"Daily": "D", "Weekly": "W-MON", "Monthly": "MS"}
+PERIOD = "ช่วงเวลา"
+COMPLIANCE = "อัตราการใส่หมวก"
+CSV_CHUNK_ROWS = 50_000
+OTHERS = "อื่นๆ"
+
+# Orderings offered for the vendor table: label -> (columns, ascending).
+# Ties are broken by the number of people checked, most first.
+VENDOR_ORDER = {
+    "Compliance, worst first": ([COMPLIANCE, "คนทั้งหมด"], [True, False]),
+    "Compliance, best first": ([COMPLIANCE, "คนทั้งหมด"], [False, False]),
+    "People checked": (["คนทั้งหมด", COMPLIANCE], [False, True]),
+    "ผู้รับเหมา": (["ผู้รับเหมา"], [True]),
+}
+
+# Data behind each dashboard page, without any Streamlit calls. `data` is a
+# store.Dataset and `filters` a {column: value} dict as built by get_filters.
+
+
+# Overview page: the matching raw rows and their totals
+def overview(data, filters, start, end):
+    return data.select(start, end, filters), data.cube.totals(start, end, filters)
+
+
+# CSV download of the overview rows, built only when asked for
+def overview_csv(data, filters, start, end):
+    return b"".join(iter_csv(data.select(start, end, filters)))
+
+
+# By-Area and by-Vendor pages: totals per value of column
+def group_totals(data, column, filters, start, end):
+    return data.cube.totals_by(column, start, end, filters)
+
+
+# Hotspots page: the k worst stores, vendors or areas (level) by their
+# rolling window-day compliance, and every sudden drop
+def hotspots(data, level, filters, window, k):
+    return data.rolling().rank(level, filters, window, k)
+
+
+# Monthly report figures, or None when nothing was inspected in the range
+def monthly_report(data, filters, start, end):
+    cells = data.cube.select(start, end, filters)
+    if cells.empty:
+        return None
+    totals = cells[COUNT_COLUMNS].sum()
+    total_days = cells[DAY].nunique()
+    return {
+        "helmet_count": totals["จำนวนคนใส่หมวก"],
+        "no_helmet_count": totals["คนไม่ใส่หมวก"],
+        "person_count": totals["คนทั้งหมด"],
+        "total_days": total_days,
+        "average_helmet_per_day": totals["จำนวนคนใส่หมวก"] / total_days,
+        "average_no_helmet_per_day": totals["คนไม่ใส่หมวก"] / total_days,
+        "vendor_analysis": with_compliance(cells.groupby("ผู้รับเหมา", observed=True)[COUNT_COLUMNS].sum().reset_index()),
+    }
+
+
+# HTML insights and summary of a monthly report, as shown on the monthly page;
+# extra is HTML appended below the summary boxes
+def monthly_html(report, year, month, extra=""):
+    helmet_count = report["helmet_count"]
+    no_helmet_count = report["no_helmet_count"]
+    person_count = report["person_count"]
+    average_helmet_per_day = report["average_helmet_per_day"]
+    average_no_helmet_per_day = report["average_no_helmet_per_day"]
+    return f"""
+        <!DOCTYPE html>
+        <html lang="en">
+        <head>
+            <meta charset="UTF-8">
+            <meta name="viewport" content="width=device-width, initial-scale=1.0">
+            <title>Monthly Report</title>
+            <style>
+                body {{
+                    font-family: Arial, sans-serif;
+                    background-color: #f0f0f0;
+                    padding: 20px;
+                }}
+                .report {{
+                    background-color: #ffffff;
+                    padding: 30px;
+                    border-radius: 20px;
+                    box-shadow: 0 0 10px rgba(0, 0, 0, 0.1);
+                    text-align: center;
+                    max-width: 800px;
+                    margin: auto;
+                }}
+                .report h1 {{
+                    color: #333333;
+                    font-size: 2em;
+                    margin: 0 0 20px;
+                }}
+                .summary {{
+                    display: flex;
+                    flex-wrap: wrap;
+                    justify-content: space-around;
+                    margin-bottom: 20px;
+                }}
+                .summary div {{
+                    background-color: #f0f0f0;
+                    padding: 20px;
+                    border-radius: 10px;
+                    margin: 10px;
+                    text-align: center;
+                    flex: 1 1 calc(33% - 40px);
+                    box-shadow: 0 0 5px rgba(0, 0, 0, 0.1);
+                }}
+                .summary div h2 {{
+                    margin: 0;
+                    font-size: 1.5em;
+                    color: #555555;
+                }}
+                .summary div p {{
+                    margin: 10px 0 0;
+                    font-size: 1.2em;
+                    color: #777777;
+                }}
+            </style>
+        </head>
+        <body>
+            <div class="report">
+                <h1>รายงานประจำเดือน {calendar.month_name[month]} {year}</h1>
+                <div class="summary">
+                    <div>
+                        <h2>จำนวนคนใส่หมวก</h2>
+                        <p>{helmet_count} คน</p>
+                    </div>
+                    <div>
+                        <h2>จำนวนคนไม่ใส่หมวก</h2>
+                        <p>{no_helmet_count} คน</p>
+                    </div>
+                    <div>
+                        <h2>จำนวนคนทั้งหมด</h2>
+                        <p>{person_count} คน</p>
+                    </div>
+                    <div>
+                        <h2>เฉลี่ยจำนวนคนใส่หมวกต่อวัน</h2>
+                        <p>{average_helmet_per_day:.2f} คน</p>
+                    </div>
+                    <div>
+                        <h2>เฉลี่ยจำนวนคนไม่ใส่หมวกต่อวัน</h2>
+                        <p>{average_no_helmet_per_day:.2f} คน</p>
+                    </div>
+                </div>{extra}
+            </div>
+        </body>
+        </html>
+        """
+
+
+# Share of the people checked (คนทั้งหมด) who wore a helmet, NaN when nobody was checked
+def compliance(table):
+    checked = table["คนทั้งหมด"]
+    return (table["จำนวนคนใส่หมวก"] / checked.where(checked > 0)).astype("float64")
+
+
+def with_compliance(table):
+    table[COMPLIANCE] = compliance(table)
+    return table
+
+
+# Vendor rows sorted by one of VENDOR_ORDER; vendors with nobody checked go last
+def sort_vendors(vendors, order):
+    columns, ascending = VENDOR_ORDER[order]
+    return vendors.sort_values(columns, ascending=ascending, kind="stable", na_position="last", ignore_index=True)
+
+
+# The k vendors with the lowest (worst=True) or highest compliance
+def top_vendors(vendors, k, worst=True):
+    ranked = vendors[vendors[COMPLIANCE].notna()]
+    return sort_vendors(ranked, "Compliance, worst first" if worst else "Compliance, best first").head(k)
+
+
+# The n groups of a totals table with the most people checked, largest
+# first, and the remaining groups summed into one OTHERS row
+def top_groups(table, column, n):
+    if len(table) <= n + 1:
+        return table
+    table = table.sort_values("คนทั้งหมด", ascending=False, kind="stable").astype({column: object})
+    rest = table.iloc[n:][COUNT_COLUMNS].sum()
+    others = pd.DataFrame({column: [f"{OTHERS} ({len(table) - n})"], **{col: [rest[col]] for col in COUNT_COLUMNS}})
+    return pd.concat([table.iloc[:n], others], ignore_index=True)
+
+
+# Rows sorted on one column; rows are already in time order, so that sort is free
+def sort_rows(df, column, ascending=True):
+    if column == "เวลา" and ascending:
+        return df
+    return df.sort_values(column, ascending=ascending, kind="stable", na_position="last")
+
+
+# CSV encoding of a frame, yielded chunk_rows rows at a time as UTF-8 with a
+# BOM so spreadsheet programs read the Thai text
+def iter_csv(df, chunk_rows=CSV_CHUNK_ROWS):
+    yield codecs.BOM_UTF8
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=start == 0).encode("utf-8")
+
+
+# Rows of one page (numbered from 1) of a sorted table, and the page count
+def paginate(table, page, size):
+    pages = max(1, -(-len(table) // size))
+    page = min(max(page, 1), pages)
+    return table.iloc[(page - 1) * size:page * size], pages
+
+
+# Date-range report: counts and compliance per period (FREQUENCIES key) for
+# each value of column, or for all matching rows when column is None. The
+# daily cube cells in the range are bucketed with a time Grouper in one
+# vectorized groupby.
+def trend(data, column, filters, start, end, freq):
+    cells = data.cube.select(start, end, filters)
+    grouper = pd.Grouper(key=DAY, freq=FREQUENCIES[freq], label="left", closed="left")
+    keys = [grouper] if column is None else [grouper, column]
+    table = cells.groupby(keys, sort=True, observed=True)[COUNT_COLUMNS].sum()
+    table = table[table.sum(axis=1) > 0]
+    return with_compliance(table.reset_index().rename(columns={DAY: PERIOD}))
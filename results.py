@@ -0,0 +1,92 @@
+import collections
+import os
+import sys
+import threading
+
+import pandas as pd
+
+# Memory budget of the page result cache, in MB
+RESULT_CACHE_MB = float(os.environ.get("HELMET_RESULT_CACHE_MB", "64"))
+
+
+# Approximate bytes held by a page result (frames, series, dicts and tuples of them)
+def result_size(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=False, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=False, deep=True))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(result_size(v) for v in value.values())
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(result_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def _key_part(arg):
+    return tuple(sorted(arg.items())) if isinstance(arg, dict) else arg
+
+
+# Server-wide LRU of page results keyed by (data version, report function,
+# its arguments: column, filters and date range), bounded by the approximate
+# bytes of the cached results.
+# Entries for older data versions are dropped as soon as a newer version is
+# seen; reruns still holding an older version compute without caching.
+# Cached results are shared between sessions and must not be modified.
+class ResultCache:
+    def __init__(self, max_bytes=RESULT_CACHE_MB * 2**20, metrics=None):
+        self.max_bytes = max_bytes
+        self.metrics = metrics
+        self.version = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = collections.OrderedDict()  # key -> (result, size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _inc(self, event, value=1):
+        if self.metrics is not None and value:
+            self.metrics.inc("result_cache", event, value)
+
+    # fn(data, *args) for one of the reports.py page functions, computed at
+    # most once per data version while it stays cached
+    def call(self, fn, data, *args):
+        key = (fn.__name__,) + tuple(_key_part(arg) for arg in args)
+        with self._lock:
+            if self.version is None or data.version > self.version:
+                self._inc("invalidation", len(self._entries))
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                self.bytes = 0
+                self.version = data.version
+            current = data.version == self.version
+            if current and key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self._inc("hit")
+                return self._entries[key][0]
+            self.misses += 1
+            self._inc("miss")
+        result = fn(data, *args)
+        if current:
+            self._put(key, result, data.version)
+        return result
+
+    def _put(self, key, result, version):
+        size = result_size(result)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if version != self.version or key in self._entries:
+                return
+            self._entries[key] = (result, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+                self._inc("eviction")
@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from cube import DAY
+
+# Days of daily totals the rates are computed from
+HISTORY = 30
+WINDOWS = (7, 30)
+
+# A 7-day rate this many percentage points under the 30-day rate is a sudden drop
+DROP_POINTS = float(os.environ.get("HELMET_DROP_POINTS", "10"))
+# People checked in the last 7 days before a store, vendor or area is ranked
+MIN_CHECKED = int(os.environ.get("HELMET_MIN_CHECKED", "20"))
+
+LEVELS = ["รหัสร้าน", "ผู้รับเหมา", "ภาค"]
+MEASURES = ["จำนวนคนใส่หมวก", "คนทั้งหมด"]
+RATE_7, RATE_30, PREVIOUS_7 = "7 วัน (%)", "30 วัน (%)", "7 วันก่อนหน้า (%)"
+CHECKED_7, CHECKED_30 = "ตรวจ 7 วัน", "ตรวจ 30 วัน"
+CHANGE, DROP = "เปลี่ยน (จุด)", "ลดลงฉับพลัน"
+
+# (helmet, checked) sums taken per entity: the last 7 days, all HISTORY days
+# and the 7 days before the last 7
+_SUMS = {"7": (0, 7), "30": (0, HISTORY), "previous": (7, 14)}
+
+
+def _rate(helmet, checked):
+    return (helmet / checked.where(checked > 0) * 100).round(1)
+
+
+# Rolling 7 and 30 day helmet compliance (จำนวนคนใส่หมวก / คนทั้งหมด) per
+# store, vendor or area, as of the last day in the data. The rates are summed
+# from the last HISTORY days of the daily cube, which is itself updated
+# incrementally, so a new data version costs one pass over those cells.
+class Rolling:
+    def __init__(self, cube):
+        self.cube = cube
+        table = cube.table
+        self.as_of = table[DAY].iloc[-1] if len(table) else None  # last day with inspections
+
+    # Cube cells of the last HISTORY days matching every page filter
+    def cells(self, filters=None):
+        if self.as_of is None:
+            return self.cube.table.iloc[:0]
+        return self.cube.select(self.as_of - pd.Timedelta(days=HISTORY - 1), None, filters)
+
+    # Rates of every entity of a level with inspections in the last HISTORY
+    # days matching the filters: 7 and 30 day rates, the 7 days before those,
+    # the change of the 7-day rate against the 30-day rate, and whether that
+    # is a sudden drop. Stores also show the area and vendor of their latest
+    # matching inspection.
+    def rates(self, level, filters=None):
+        cells = self.cells(filters)
+        age = np.zeros(0, dtype="int64") if self.as_of is None else (self.as_of - cells[DAY]).dt.days.to_numpy()
+        sums = {}
+        for name, (lo, hi) in _SUMS.items():
+            inside = (age >= lo) & (age < hi)
+            for col in MEASURES:
+                sums[name, col] = np.where(inside, cells[col].to_numpy(), 0)
+        totals = pd.DataFrame(sums, index=cells.index).groupby(cells[level], sort=True, observed=True).sum()
+        helmet, checked = MEASURES
+        table = pd.DataFrame({
+            CHECKED_7: totals["7", checked],
+            RATE_7: _rate(totals["7", helmet], totals["7", checked]),
+            CHECKED_30: totals["30", checked],
+            RATE_30: _rate(totals["30", helmet], totals["30", checked]),
+            PREVIOUS_7: _rate(totals["previous", helmet], totals["previous", checked]),
+        })
+        table = table[table[CHECKED_30] > 0].copy()
+        table[CHANGE] = table[RATE_7] - table[RATE_30]
+        table[DROP] = (table[CHECKED_7] >= MIN_CHECKED) & (table[CHANGE] <= -DROP_POINTS)
+        if level == LEVELS[0]:
+            latest = cells.drop_duplicates(level, keep="last").set_index(level)[LEVELS[1:]]
+            table = table.join(latest)
+        return table.rename_axis(level).reset_index()
+
+    # The k worst entities by their window-day rate, among those checked
+    # often enough, and every sudden drop, largest first
+    def rank(self, level, filters, window, k):
+        table = self.rates(level, filters)
+        rate = RATE_7 if window == 7 else RATE_30
+        ranked = table[table[CHECKED_7 if window == 7 else CHECKED_30] >= MIN_CHECKED]
+        worst = ranked.sort_values([rate, CHECKED_7], ascending=[True, False], kind="stable").head(k)
+        drops = table[table[DROP]].sort_values(CHANGE, kind="stable")
+        return worst, drops
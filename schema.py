@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+# Declared types of an inspection record. The area, vendor and store labels
+# repeat on every row and become categoricals; the counts use the smallest
+# unsigned type that holds any single inspection; เวลา is datetime64.
+TIME_COLUMN = "เวลา"
+CATEGORY_COLUMNS = ["ภาค", "ผู้รับเหมา", "รหัสร้าน"]
+COUNT_COLUMNS = ["จำนวนคนใส่หมวก", "คนไม่ใส่หมวก", "คนทั้งหมด"]
+COUNT_DTYPE = np.dtype("uint16")
+
+SCHEMA = {
+    TIME_COLUMN: np.dtype("datetime64[ns]"),
+    **{col: "category" for col in CATEGORY_COLUMNS},
+    **{col: COUNT_DTYPE for col in COUNT_COLUMNS},
+}
+
+# Validation rules, by the name they are reported under
+BAD_TIME = "unreadable เวลา (row dropped)"
+BAD_COUNT = "count not a whole number in range (set to 0)"
+
+
+# Bytes held by a frame, strings included
+def footprint(df):
+    return int(df.memory_usage(index=False, deep=True).sum())
+
+
+# Running totals for the rows passed through conform: their size as text
+# and once typed, and how many broke each validation rule
+class IngestReport:
+    def __init__(self):
+        self.rows = 0
+        self.text_bytes = 0
+        self.typed_bytes = 0
+        self.invalid = {}
+
+    def flag(self, rule, count):
+        if count:
+            self.invalid[rule] = self.invalid.get(rule, 0) + int(count)
+
+
+# Parse เวลา into datetime64; ISO timestamps take the fast path and anything
+# else is retried one value at a time
+def parse_times(values):
+    times = pd.to_datetime(values, format="ISO8601", errors="coerce")
+    retry = times.isna() & values.ne("")
+    if retry.any():
+        times[retry] = pd.to_datetime(values[retry], format="mixed", errors="coerce")
+    return times
+
+
+# Counts as COUNT_DTYPE; blanks are 0 and invalid values are 0 and flagged
+def _counts(values, report):
+    numbers = pd.to_numeric(values, errors="coerce")
+    limit = np.iinfo(COUNT_DTYPE).max
+    present = numbers.notna()
+    invalid = (~present & values.notna() & values.ne("")) | (present & ((numbers < 0) | (numbers > limit) | (numbers % 1 != 0)))
+    if report is not None:
+        report.flag(BAD_COUNT, invalid.sum())
+    return numbers.mask(invalid).fillna(0).astype(COUNT_DTYPE)
+
+
+# Cast a frame of text cells (or an already typed one) to SCHEMA, dropping
+# rows whose เวลา cannot be read. Columns outside the schema are kept as is.
+def conform(df, report=None):
+    if report is not None:
+        report.rows += len(df)
+        report.text_bytes += footprint(df)
+    if TIME_COLUMN in df:
+        times = df[TIME_COLUMN]
+        if times.dtype != SCHEMA[TIME_COLUMN]:
+            times = parse_times(times)
+        df[TIME_COLUMN] = times
+        if times.isna().any():
+            if report is not None:
+                report.flag(BAD_TIME, times.isna().sum())
+            df = df[times.notna()].reset_index(drop=True)
+    for col in COUNT_COLUMNS:
+        if col in df and df[col].dtype != COUNT_DTYPE:
+            df[col] = _counts(df[col], report)
+    for col in CATEGORY_COLUMNS:
+        if col in df and df[col].dtype != "category":
+            df[col] = df[col].astype("category")
+    if report is not None:
+        report.typed_bytes += footprint(df)
+    return df
+
+
+# pd.concat that keeps the categorical columns categorical: frames whose
+# categories differ would otherwise fall back to object columns
+def concat(frames):
+    frames = list(frames)
+    for col in CATEGORY_COLUMNS:
+        if all(col in df and df[col].dtype == "category" for df in frames):
+            categories = pd.api.types.union_categoricals([df[col] for df in frames], sort_categories=True).categories
+            frames = [df.assign(**{col: df[col].cat.set_categories(categories)}) for df in frames]
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,158 @@
+import glob
+import json
+import os
+import shutil
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are not serialized across processes
+    fcntl = None
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Where the local copy of the sheet is kept between restarts
+SNAPSHOT_DIR = os.environ.get("HELMET_SNAPSHOT_DIR", "snapshot")
+
+UNKNOWN_MONTH = "unknown"
+
+# Bumped whenever the stored columns change; older snapshots are ignored
+FORMAT_VERSION = 4
+
+
+# Year-month partition key ("2024-05") of every row, from the เวลา column
+def month_keys(df):
+    return df["เวลา"].dt.strftime("%Y-%m").fillna(UNKNOWN_MONTH)
+
+
+# Columnar copy of the ingested rows on local disk, one Parquet file per
+# month of เวลา, plus the sync position so a restart can resume incrementally.
+# Every write builds a new generation directory (unchanged months are hard
+# links to the previous one) holding the partitions and the state, then
+# switches the CURRENT pointer to it in one rename, so the partitions and
+# the sync state on disk always belong together. Writers (the server, a
+# batch run sharing the directory) take a lock file for the whole write, and
+# a write only removes the generation it replaced and older ones.
+class SnapshotStore:
+    def __init__(self, path=SNAPSHOT_DIR):
+        self.path = path
+
+    def _pointer(self):
+        return os.path.join(self.path, "CURRENT")
+
+    # Directory of the current generation, or None before the first write
+    # or when it has gone missing
+    def _current(self):
+        try:
+            with open(self._pointer(), encoding="utf-8") as f:
+                name = f.read().strip()
+        except FileNotFoundError:
+            return None
+        generation = os.path.join(self.path, name)
+        return generation if name and os.path.isdir(generation) else None
+
+    def _partition(self, month, generation=None):
+        return os.path.join(generation or self._current(), f"month={month}.parquet")
+
+    def months(self, generation=None):
+        generation = generation or self._current()
+        if generation is None:
+            return []
+        files = glob.glob(os.path.join(generation, "month=*.parquet"))
+        return sorted(os.path.basename(f)[len("month="):-len(".parquet")] for f in files)
+
+    def exists(self):
+        generation = self._current()
+        if generation is None:
+            return False
+        try:
+            return self.read_state(generation).get("format") == FORMAT_VERSION
+        except FileNotFoundError:
+            return False
+
+    def read_state(self, generation=None):
+        with open(os.path.join(generation or self._current(), "state.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    # Load every partition and the sync state of one generation; files are
+    # memory-mapped rather than read into buffers. Partitions are written
+    # sorted by เวลา, so the result stays sorted. A generation removed while
+    # it is read counts as no snapshot.
+    def load(self):
+        generation = self._current()
+        if generation is None:
+            return None, None
+        try:
+            state = self.read_state(generation)
+            tables = [pq.read_table(self._partition(m, generation), memory_map=True) for m in self.months(generation)]
+        except FileNotFoundError:
+            return None, None
+        if not tables:
+            return None, state
+        return pa.concat_tables(tables).to_pandas(), state
+
+    # Load a single month without touching the rest of the history, or None
+    # when the snapshot has no rows for it
+    def read_month(self, year, month):
+        generation = self._current()
+        if generation is None or not self.exists():
+            return None
+        try:
+            return pq.read_table(self._partition(f"{year}-{month:02d}", generation), memory_map=True).to_pandas()
+        except FileNotFoundError:
+            return None
+
+    # Latest (year, month) with rows in the snapshot, or None
+    def latest_month(self):
+        months = [m for m in self.months() if m != UNKNOWN_MONTH]
+        if not months or not self.exists():
+            return None
+        return int(months[-1][:4]), int(months[-1][5:])
+
+    # Write the partitions for the given months (all of them when None) and
+    # the sync state as a new generation, then make it the current one
+    def write(self, df, state, months=None):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "LOCK"), "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            self._write(df, state, months)
+
+    def _write(self, df, state, months):
+        current = self._current()
+        keys = month_keys(df)
+        if months is None or current is None:
+            months = set(keys)
+        number = time.time_ns() if current is None else max(time.time_ns(), _generation_number(current) + 1)
+        generation = os.path.join(self.path, f"gen-{number}")
+        os.makedirs(generation)
+        for month in set(self.months(current)) - set(months):
+            _link(self._partition(month, current), self._partition(month, generation))
+        for month in months:
+            part = df[keys == month]
+            pq.write_table(pa.Table.from_pandas(part, preserve_index=False), self._partition(month, generation))
+        with open(os.path.join(generation, "state.json"), "w", encoding="utf-8") as f:
+            json.dump(dict(state, format=FORMAT_VERSION), f, ensure_ascii=False)
+        tmp = self._pointer() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(os.path.basename(generation))
+        os.replace(tmp, self._pointer())
+        # The replaced generation, and older ones left behind by an interrupted write
+        if current is not None:
+            for old in glob.glob(os.path.join(self.path, "gen-*")):
+                if _generation_number(old) <= _generation_number(current):
+                    shutil.rmtree(old, ignore_errors=True)
+
+
+def _generation_number(path):
+    return int(os.path.basename(path)[len("gen-"):])
+
+
+# Hard link a partition into the new generation, or copy it where the file
+# system has no hard links
+def _link(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
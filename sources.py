@@ -0,0 +1,266 @@
+import csv
+import datetime
+import itertools
+import os
+import sqlite3
+import threading
+import time
+
+import gspread
+import requests
+from google.auth.transport.requests import AuthorizedSession, Request
+from google.oauth2.service_account import Credentials
+
+from fakesheet import FAKE_ERROR_RATE, FakeSheet
+
+# Which backend serves the inspection log: "gsheet", "sqlite:<path>",
+# "csv:<path>" or "fake:<csv path>" (an offline fake of the Sheets API)
+DATA_SOURCE = os.environ.get("HELMET_SOURCE", "gsheet")
+SHEET_ID = os.environ.get("HELMET_SHEET_ID", "1WpsBMMpp9KC3YYhySeAq1ZQ9mp5KFOrrlJlm-zqttb4")
+CREDENTIALS_FILE = os.environ.get("HELMET_CREDENTIALS", "credentials.json")
+
+# Keep-alive connections to the Sheets API shared by all sessions
+POOL_SIZE = int(os.environ.get("HELMET_POOL_SIZE", "10"))
+TOKEN_REFRESH_MARGIN = 300  # renew the access token this many seconds before it expires
+
+
+def _cell(value):
+    return "" if value is None else str(value)
+
+
+# Interface of an inspection log backend. Rows are lists of cell strings in
+# sheet column order; data rows are numbered from 0, below the header.
+class DataSource:
+    # Header row followed by every data row
+    def values(self):
+        raise NotImplementedError
+
+    # Header row and the data rows from position start onwards, in one read
+    def tail(self, start):
+        values = self.values()
+        return values[0] if values else [], values[1 + start:]
+
+    # Header row and the data rows in positions start..stop-1, in one read
+    def rows(self, start, stop):
+        values = self.values()
+        return values[0] if values else [], values[1 + start:1 + stop]
+
+    # 1-based column, header included, like gspread's col_values
+    def col_values(self, col):
+        return [row[col - 1] if len(row) >= col else "" for row in self.values()]
+
+    def row_count(self):
+        return max(len(self.values()) - 1, 0)
+
+    def records(self):
+        values = self.values()
+        if not values:
+            return []
+        header = values[0]
+        return [dict(zip(header, row + [""] * (len(header) - len(row)))) for row in values[1:]]
+
+
+# One authorized Google Sheets client per credentials file, shared by every
+# rerun and session. It connects on first use, keeps its HTTP connections
+# alive, and renews the access token in the background before it expires,
+# so requests never wait on the OAuth handshake.
+class SheetsClient:
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, credentials_file=CREDENTIALS_FILE, metrics=None):
+        with cls._shared_lock:
+            if credentials_file not in cls._shared:
+                cls._shared[credentials_file] = cls(credentials_file, metrics)
+            return cls._shared[credentials_file]
+
+    def __init__(self, credentials_file, metrics=None):
+        self.credentials_file = credentials_file
+        self.metrics = metrics
+        self._creds = None
+        self._auth_request = None
+        self._client = None
+        self._sheets = {}
+        self._lock = threading.Lock()
+
+    def _timed(self, phase, fn):
+        started = time.perf_counter()
+        result = fn()
+        if self.metrics is not None:
+            self.metrics.observe("connect", phase, time.perf_counter() - started)
+        return result
+
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                scopes = ["https://www.googleapis.com/auth/spreadsheets"]
+                creds = Credentials.from_service_account_file(self.credentials_file, scopes=scopes)
+                # Token requests go out on a plain session; the authorized
+                # session only attaches the token to the Sheets API calls
+                adapter = requests.adapters.HTTPAdapter(pool_maxsize=POOL_SIZE)
+                token_session = requests.Session()
+                token_session.mount("https://", adapter)
+                auth_request = Request(token_session)
+                session = AuthorizedSession(creds, auth_request=auth_request)
+                session.mount("https://", adapter)
+                self._timed("authorize", lambda: creds.refresh(auth_request))
+                self._creds = creds
+                self._auth_request = auth_request
+                self._client = gspread.Client(None, session=session)
+                threading.Thread(target=self._keep_token_fresh, daemon=True).start()
+            return self._client
+
+    # First worksheet of a spreadsheet, opened once and then reused
+    def worksheet(self, sheet_id):
+        client = self.client()
+        with self._lock:
+            if sheet_id not in self._sheets:
+                self._sheets[sheet_id] = self._timed("open", lambda: client.open_by_key(sheet_id).sheet1)
+            return self._sheets[sheet_id]
+
+    def _keep_token_fresh(self):
+        while True:
+            expires_in = (self._creds.expiry - datetime.datetime.utcnow()).total_seconds()
+            time.sleep(max(expires_in - TOKEN_REFRESH_MARGIN, 30))
+            try:
+                self._timed("token_refresh", lambda: self._creds.refresh(self._auth_request))
+            except Exception:
+                pass  # AuthorizedSession still refreshes on demand if this keeps failing
+
+
+# The first worksheet of the Google Sheet, connected on first access.
+# A worksheet object can be passed in instead, e.g. a fakesheet.FakeSheet.
+class GSheetSource(DataSource):
+    def __init__(self, sheet_id=SHEET_ID, credentials_file=CREDENTIALS_FILE, metrics=None, worksheet=None):
+        self.sheet_id = sheet_id
+        self.worksheet = worksheet
+        self.client = None if worksheet is not None else SheetsClient.shared(credentials_file, metrics)
+
+    @property
+    def sheet(self):
+        if self.worksheet is not None:
+            return self.worksheet
+        return self.client.worksheet(self.sheet_id)
+
+    def values(self):
+        return self.sheet.get_values()
+
+    def _last_col(self):
+        return gspread.utils.rowcol_to_a1(1, self.sheet.col_count).rstrip("0123456789")
+
+    def tail(self, start):
+        header, rows = self.sheet.batch_get(["1:1", f"A{start + 2}:{self._last_col()}"])
+        return header[0] if header else [], [list(row) for row in rows]
+
+    def rows(self, start, stop):
+        header, rows = self.sheet.batch_get(["1:1", f"A{start + 2}:{self._last_col()}{stop + 1}"])
+        return header[0] if header else [], [list(row) for row in rows]
+
+    def col_values(self, col):
+        return self.sheet.col_values(col)
+
+    # Grid size from the worksheet metadata fetched when it was opened, so
+    # sizing a full download costs no read; it may include blank rows at the
+    # end or miss rows appended since
+    def row_count(self):
+        return max(self.sheet.row_count - 1, 0)
+
+
+# Offline stand-in: a SQLite table whose columns are the sheet's header,
+# with rows in rowid order
+class SQLiteSource(DataSource):
+    def __init__(self, path, table="inspections"):
+        self.path = path
+        self.table = table
+
+    # Create (or replace) the table from a header and rows
+    @classmethod
+    def create(cls, path, header, rows, table="inspections"):
+        with sqlite3.connect(path) as conn:
+            columns = ", ".join(f'"{name}"' for name in header)
+            conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+            conn.execute(f'CREATE TABLE "{table}" ({columns})')
+            marks = ", ".join("?" * len(header))
+            conn.executemany(f'INSERT INTO "{table}" VALUES ({marks})', rows)
+        return cls(path, table)
+
+    def _query(self, sql, params=()):
+        with sqlite3.connect(self.path) as conn:
+            cursor = conn.execute(sql, params)
+            header = [d[0] for d in cursor.description]
+            return header, [[_cell(v) for v in row] for row in cursor]
+
+    def values(self):
+        header, rows = self._query(f'SELECT * FROM "{self.table}" ORDER BY rowid')
+        return [header] + rows
+
+    def tail(self, start):
+        return self._query(f'SELECT * FROM "{self.table}" ORDER BY rowid LIMIT -1 OFFSET ?', (start,))
+
+    def rows(self, start, stop):
+        return self._query(f'SELECT * FROM "{self.table}" ORDER BY rowid LIMIT ? OFFSET ?', (stop - start, start))
+
+    def col_values(self, col):
+        header, rows = self._query(f'SELECT * FROM "{self.table}" LIMIT 0')
+        name = header[col - 1]
+        _, rows = self._query(f'SELECT "{name}" FROM "{self.table}" ORDER BY rowid')
+        return [name] + [row[0] for row in rows]
+
+    def row_count(self):
+        with sqlite3.connect(self.path) as conn:
+            return conn.execute(f'SELECT COUNT(*) FROM "{self.table}"').fetchone()[0]
+
+
+# Offline stand-in: a CSV export of the sheet, header first
+class CSVSource(DataSource):
+    def __init__(self, path):
+        self.path = path
+        self._cursor = None  # [next row, file, reader, header, file version] of an unfinished chunked read
+
+    def values(self):
+        with open(self.path, newline="", encoding="utf-8-sig") as f:
+            return list(csv.reader(f))
+
+    def row_count(self):
+        with open(self.path, newline="", encoding="utf-8-sig") as f:
+            return max(sum(1 for _ in csv.reader(f)) - 1, 0)
+
+    # Streams the file. A read starting where the previous one stopped
+    # continues from the open reader instead of re-reading from the top,
+    # unless the file has been replaced or modified since.
+    def rows(self, start, stop):
+        info = os.stat(self.path)
+        version = (info.st_ino, info.st_mtime_ns, info.st_size)
+        if self._cursor is None or self._cursor[0] != start or self._cursor[4] != version:
+            self._close()
+            f = open(self.path, newline="", encoding="utf-8-sig")
+            reader = csv.reader(f)
+            header = next(reader, [])
+            next(itertools.islice(reader, start, start), None)
+            self._cursor = [start, f, reader, header, version]
+        _, _, reader, header, _ = self._cursor
+        rows = list(itertools.islice(reader, stop - start))
+        self._cursor[0] = stop
+        if len(rows) < stop - start:
+            self._close()
+        return header, rows
+
+    def _close(self):
+        if self._cursor is not None:
+            self._cursor[1].close()
+            self._cursor = None
+
+
+# Backend selected by a HELMET_SOURCE style spec
+def open_source(spec=DATA_SOURCE, metrics=None):
+    kind, _, path = spec.partition(":")
+    if kind == "gsheet":
+        return GSheetSource(path or SHEET_ID, metrics=metrics)
+    if kind == "sqlite":
+        return SQLiteSource(path)
+    if kind == "csv":
+        return CSVSource(path)
+    if kind == "fake":
+        return GSheetSource(worksheet=FakeSheet.from_csv(path, error_rate=FAKE_ERROR_RATE))
+    raise ValueError(f"Unknown data source: {spec}")
@@ -0,0 +1,254 @@
+import calendar
+import datetime
+import os
+import threading
+import time
+
+from cube import Cube
+from index import FilterIndex, time_bounds
+from rolling import Rolling
+from schema import concat, footprint
+from snapshot import month_keys
+from sync import follows, sort_by_time
+
+# How long the local copy is served before syncing with the sheet, in seconds
+CACHE_TTL = int(os.environ.get("HELMET_CACHE_TTL", "300"))
+
+# How often the background poller syncs with the sheet, in seconds
+POLL_INTERVAL = int(os.environ.get("HELMET_POLL_INTERVAL", "60"))
+
+
+def day_range(day):
+    return day, day + datetime.timedelta(days=1)
+
+
+def month_range(year, month):
+    start = datetime.date(year, month, 1)
+    return start, start + datetime.timedelta(days=calendar.monthrange(year, month)[1])
+
+
+# One immutable version of the ingested data: the time-sorted frame, the
+# filter index built over it, the daily rollup cube and the rolling
+# compliance rates over that cube
+class Dataset:
+    def __init__(self, df, index=None, cube=None, version=1):
+        self.df = df
+        self.index = index if index is not None else FilterIndex(df)
+        self.cube = cube if cube is not None else Cube.build(df)
+        self.version = version
+        self._options = {}
+        self._footprint = None
+
+    # New version with appended rows. The cube is always updated
+    # incrementally; the index is extended in place of a rebuild unless the
+    # rows arrived out of time order.
+    def extend(self, new):
+        if new.empty:
+            return self
+        df = concat([self.df, new])
+        cube = self.cube.extend(new)
+        if follows(self.df, new):
+            return Dataset(df, self.index.extend(new, len(self.df)), cube, self.version + 1)
+        return Dataset(sort_by_time(df), cube=cube, version=self.version + 1)
+
+    # Rolling 7 / 30 day compliance over the cube
+    def rolling(self):
+        return Rolling(self.cube)
+
+    # Sorted distinct values of a filter column, computed once per version
+    def options(self, column):
+        if column not in self._options:
+            self._options[column] = sorted(self.index.columns[column].values)
+        return self._options[column]
+
+    # First and last เวลา, or None when there are no rows
+    def span(self):
+        if self.df.empty:
+            return None
+        times = self.df["เวลา"]
+        return times.iloc[0], times.iloc[-1]
+
+    # Years with inspections, for the year selectors
+    def years(self):
+        span = self.span()
+        if span is None:
+            return [datetime.date.today().year]
+        return list(range(span[0].year, span[1].year + 1))
+
+    # Bytes held by the rows, computed once per version
+    def footprint(self):
+        if self._footprint is None:
+            self._footprint = footprint(self.df)
+        return self._footprint
+
+    # Rows with start <= เวลา < end matching every {column: value} filter
+    def select(self, start=None, end=None, filters=None):
+        lo, hi = time_bounds(self.df, start, end)
+        return self.df.iloc[self.index.lookup(filters or {}, lo, hi)]
+
+
+# Process-wide cache around the sheet data, shared by every session.
+# Sessions read whichever Dataset is currently published. Only the very first
+# load blocks: after that an expired copy keeps being served while a single
+# refresh fetches the new rows in the background, and a poller keeps the copy
+# fresh between visits. On first use the copy comes from the local snapshot
+# when there is one.
+class DataStore:
+    _polling = None  # the store whose poller is running
+    _polling_lock = threading.Lock()
+
+    def __init__(self, sync, snapshot=None, ttl=CACHE_TTL):
+        self.sync = sync
+        self.snapshot = snapshot
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.loaded_at = None
+        self.source = None  # "snapshot" or "sheet"
+        self.last_error = None
+        self.progress = None  # (rows_done, rows_total) while a full download runs
+        self._data = None
+        self._in_flight = False
+        self._poller = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def is_stale(self):
+        return self._data is None or time.monotonic() - self.loaded_at > self.ttl
+
+    def is_refreshing(self):
+        return self._in_flight
+
+    def age(self):
+        if self._data is None:
+            return None
+        return time.monotonic() - self.loaded_at
+
+    # Return the current Dataset. Blocks only while nothing has been loaded yet;
+    # concurrent first callers wait on the same load. progress(rows_done,
+    # rows_total) is called while that load downloads the sheet.
+    def get(self, progress=None):
+        if self._data is None:
+            self.misses += 1
+            self._load_first(progress)
+        elif self.is_stale():
+            self.misses += 1
+            if not self._in_flight:
+                threading.Thread(target=self.refresh, daemon=True).start()
+        else:
+            self.hits += 1
+        return self._data
+
+    # Sync with the sheet unless a refresh is already running. Failures keep
+    # the current version and are kept in last_error.
+    def refresh(self):
+        with self._lock:
+            if self._in_flight:
+                return False
+            self._in_flight = True
+        try:
+            with self._sync_lock:
+                self._sync()
+            self.last_error = None
+        except Exception as exc:
+            self.last_error = exc
+        finally:
+            self._in_flight = False
+        return True
+
+    # Reload the whole sheet and wait for it (the sidebar refresh button)
+    def reload(self, progress=None):
+        with self._sync_lock:
+            self._sync(full=True, progress=progress)
+
+    # Load in the foreground without background threads, for scripts:
+    # restore the snapshot, then sync it with the source unless offline
+    def load(self, offline=False):
+        with self._sync_lock:
+            loaded = self._data is not None or self._restore()
+            if not offline:
+                self._sync()
+            elif not loaded:
+                raise RuntimeError("No local snapshot to load offline")
+        return self._data
+
+    # Sync every interval seconds from one daemon thread. There is one poller
+    # per process: starting it for a store that replaces another (e.g. after
+    # the resource cache was cleared) stops the old store's poller.
+    def start_polling(self, interval=POLL_INTERVAL):
+        with DataStore._polling_lock:
+            if DataStore._polling is not None and DataStore._polling is not self:
+                DataStore._polling.stop_polling()
+            DataStore._polling = self
+            if self._poller is None:
+                self._poller = Poller(self, interval)
+                self._poller.start()
+
+    def stop_polling(self):
+        if self._poller is not None:
+            self._poller.stop()
+            self._poller = None
+
+    def _load_first(self, progress=None):
+        with self._sync_lock:
+            if self._data is not None:
+                return
+            if self._restore():
+                threading.Thread(target=self.refresh, daemon=True).start()
+            else:
+                self._sync(progress=progress)
+
+    def _restore(self):
+        if self.snapshot is None or not self.snapshot.exists():
+            return False
+        df, state = self.snapshot.load()
+        if df is None:
+            return False
+        self.sync.restore(state)
+        self._publish(Dataset(df), "snapshot")
+        return True
+
+    def _sync(self, full=False, progress=None):
+        def report(done, total):
+            self.progress = (done, total)
+            if progress is not None:
+                progress(done, total)
+
+        old = self._data
+        try:
+            frame, full = self.sync.sync(old is not None and not full, report)
+        finally:
+            self.progress = None
+        if full:
+            data = Dataset(frame, version=old.version + 1 if old else 1)
+        else:
+            data = old.extend(frame)
+        self._publish(data, "sheet")
+        if self.snapshot is None:
+            return
+        if full:
+            self.snapshot.write(data.df, self.sync.state())
+        elif len(frame):
+            self.snapshot.write(data.df, self.sync.state(), set(month_keys(frame)))
+
+    def _publish(self, data, source):
+        with self._lock:
+            self._data = data
+            self.loaded_at = time.monotonic()
+            self.source = source
+
+
+# The single background worker syncing a DataStore on a fixed schedule
+class Poller(threading.Thread):
+    def __init__(self, store, interval):
+        super().__init__(name="helmet-poller", daemon=True)
+        self.store = store
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.store.refresh()
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,189 @@
+import os
+import time
+
+import pandas as pd
+
+from schema import IngestReport, concat, conform
+
+# Rows per request when the whole sheet is downloaded
+CHUNK_ROWS = int(os.environ.get("HELMET_CHUNK_ROWS", "5000"))
+
+# Already ingested rows are checksummed in slices of this many rows, and one
+# slice is re-read and checked at most once per interval (in seconds)
+VERIFY_ROWS = int(os.environ.get("HELMET_VERIFY_ROWS", "1000"))
+VERIFY_INTERVAL = float(os.environ.get("HELMET_VERIFY_INTERVAL", "300"))
+
+
+# Build the inspection DataFrame from raw sheet rows (lists of cell strings).
+# The rows are transposed into one array per column before typing, so no
+# row-shaped intermediate is built.
+def to_frame(header, rows, sort=True, report=None):
+    width = len(header)
+    rows = [row[:width] + [""] * (width - len(row)) for row in rows if any(row)]
+    columns = zip(*rows) if rows else [()] * width
+    df = pd.DataFrame({name: pd.Series(values, dtype=object) for name, values in zip(header, columns)})
+    return prepare(df, sort, report)
+
+
+# Apply the inspection schema to the raw text columns and sort by time
+def prepare(df, sort=True, report=None):
+    df = conform(df, report)
+    if sort and "เวลา" in df:
+        df = sort_by_time(df)
+    return df
+
+
+# Stable sort on เวลา so date filters can binary search; unparseable times go last
+def sort_by_time(df):
+    return df.sort_values("เวลา", kind="stable", na_position="last", ignore_index=True)
+
+
+# True when new rows can be appended after df without breaking the time order
+def follows(df, new):
+    if df.empty or new.empty:
+        return True
+    last, first = df["เวลา"].iloc[-1], new["เวลา"].iloc[0]
+    return pd.notna(last) and pd.notna(first) and first >= last
+
+
+def _strip(row):
+    row = list(row)
+    while row and row[-1] == "":
+        row.pop()
+    return row
+
+
+# Checksum of raw sheet rows: the sum of a 64-bit hash of every row, so rows
+# appended later can be added to it and it does not depend on how the rows
+# were split into requests. Blank rows are skipped, as they are on ingest.
+def checksum(header, rows):
+    width = len(header)
+    rows = [row[:width] + [""] * (width - len(row)) for row in rows if any(row)]
+    if not rows:
+        return 0
+    cells = pd.DataFrame(rows, dtype=object)
+    return int(pd.util.hash_pandas_object(cells, index=False).sum())
+
+
+# Keeps a local copy of the append-only inspection log (any DataSource) up
+# to date. A full download reads the sheet chunk_rows rows at a time and types
+# each chunk before the next is fetched, so only one chunk of raw cell
+# strings is held at once. After that only rows from the last one we
+# ingested onwards are read. The last ingested row is re-read as an anchor on
+# every sync: if it or the header changed, or it disappeared, rows were
+# edited or deleted and we fall back to a full reload. Edits further up are
+# caught by checksums kept per verify_rows rows: at most once every
+# verify_interval seconds a sync also re-reads the next slice in rotation and
+# reloads in full on a mismatch, so a sync's cost stays bounded by the new
+# rows plus one slice.
+class SheetSync:
+    def __init__(self, source, chunk_rows=CHUNK_ROWS, verify_rows=VERIFY_ROWS, verify_interval=VERIFY_INTERVAL):
+        self.source = source
+        self.chunk_rows = chunk_rows
+        self.verify_rows = verify_rows
+        self.verify_interval = verify_interval
+        self.header = None
+        self.rows_synced = 0  # data rows 0..rows_synced-1 are in the frame
+        self.anchor = None
+        self.checksums = []  # checksum of data rows i*verify_rows..(i+1)*verify_rows-1
+        self.full_reloads = 0
+        self.edit_reloads = 0
+        self._next_check = 0
+        self._verified_at = time.monotonic()
+        self.incremental_syncs = 0
+        self.rows_fetched = 0
+        self.report = IngestReport()  # rows ingested since the last full reload
+
+    # Sync position, saved alongside the local snapshot
+    def state(self):
+        return {"header": self.header, "rows_synced": self.rows_synced, "anchor": self.anchor,
+                "checksums": self.checksums, "checksum_rows": self.verify_rows}
+
+    # A state without checksums for this slice size leaves the anchor unset,
+    # so the next sync reloads in full
+    def restore(self, state):
+        self.header = state["header"]
+        self.rows_synced = state["rows_synced"]
+        self.anchor = state["anchor"]
+        self.checksums = state.get("checksums", [])
+        if state.get("checksum_rows") != self.verify_rows:
+            self.anchor = None
+
+    # Download the whole sheet. progress(rows_done, rows_total) is called
+    # after every chunk; the total is the source's row count when the download
+    # started, which only sizes the progress bar and may be an estimate.
+    def full_reload(self, progress=None):
+        total = self.source.row_count()
+        self.full_reloads += 1
+        self.report = IngestReport()
+        frames = []
+        self.checksums = []
+        start = end = 0
+        anchor = None
+        while True:
+            header, rows = self.source.rows(start, start + self.chunk_rows)
+            self.rows_fetched += len(rows)
+            header = _strip(header)
+            if rows:
+                self._add_checksums(header, rows, start)
+                frames.append(to_frame(header, rows, sort=False, report=self.report))
+                end = start + len(rows)
+                anchor = _strip(rows[-1][:len(header)])
+            del rows
+            start += self.chunk_rows
+            if progress is not None:
+                progress(end, max(total, end))
+            if start >= total and end < start:
+                break
+        self.header = header
+        self.rows_synced = end
+        self.anchor = anchor
+        if not frames:
+            return to_frame(header, [])
+        return sort_by_time(concat(frames))
+
+    # Fetch what changed since the last sync. Returns (frame, full): the whole
+    # sheet when full is True, otherwise only the rows appended since then.
+    def sync(self, loaded=True, progress=None):
+        if not loaded or self.anchor is None:
+            return self.full_reload(progress), True
+        header, tail = self.source.tail(self.rows_synced - 1)
+        self.incremental_syncs += 1
+        self.rows_fetched += len(tail)
+        if _strip(header) != self.header:
+            return self.full_reload(progress), True
+        if not tail or _strip(tail[0][:len(self.header)]) != self.anchor:
+            return self.full_reload(progress), True
+        if not self._verify():
+            self.edit_reloads += 1
+            return self.full_reload(progress), True
+        new_rows = tail[1:]
+        if new_rows:
+            self._add_checksums(self.header, new_rows, self.rows_synced)
+            self.rows_synced += len(new_rows)
+            self.anchor = _strip(new_rows[-1][:len(self.header)])
+        return to_frame(self.header, new_rows, report=self.report), False
+
+    # Once verify_interval has passed, re-read the next slice of ingested
+    # rows; False when it no longer matches its checksum
+    def _verify(self):
+        if not self.checksums or time.monotonic() - self._verified_at < self.verify_interval:
+            return True
+        self._verified_at = time.monotonic()
+        i = self._next_check % len(self.checksums)
+        self._next_check = i + 1
+        start = i * self.verify_rows
+        _, rows = self.source.rows(start, min(start + self.verify_rows, self.rows_synced))
+        self.rows_fetched += len(rows)
+        return checksum(self.header, rows) == self.checksums[i]
+
+    # Add rows read from position onwards to the checksums of their slices
+    def _add_checksums(self, header, rows, position):
+        while rows:
+            i = position // self.verify_rows
+            take = (i + 1) * self.verify_rows - position
+            part, rows = rows[:take], rows[take:]
+            while len(self.checksums) <= i:
+                self.checksums.append(0)
+            self.checksums[i] = (self.checksums[i] + checksum(header, part)) % 2**64
+            position += len(part)